@@ -0,0 +1,293 @@
+"""Emulator of the Arduino controller.
+
+This emulates `controller/controller.ino` on a pseudo-terminal (so Linux
+only), so that the game, setup and `controller.py` can be run and benchmarked
+without the board. Run it from the command line, and it prints the path of
+the terminal to use as the Arduino's port:
+
+    python emulator.py [--baudrate 9600] [--link PATH]
+
+Besides the protocol itself, the emulator models the timing that matters for
+latency:
+
+* The serial line carries 10 bits per byte (8N1), so at 9600 baud each byte
+  takes just over a millisecond to arrive, and a command is only acted on
+  once all of its bytes have.
+* Like the board, commands are handled one at a time between passes of the
+  pulse loop, so a long backlog delays pulsing.
+* Reads time out after 100 ms, as `Serial.setTimeout(100)` sets, including
+  the quirks of `Serial.parseInt` (which skips anything that isn't a digit or
+  minus sign while looking for the interval).
+* Relays are pulsed by the same `millis()` arithmetic as the board.
+
+Every relay transition is logged on a line of its own, as a timestamp (from
+`time.monotonic`, which is shared by all processes on Linux, so it can be
+compared against times taken by a client), the relay and its new state (for
+example, `1234.567890 A on`). With `--verbose`, commands are logged too.
+"""
+
+import argparse
+import os
+import select
+import sys
+import time
+import tty
+from collections import deque
+from typing import Optional
+
+RELAYS = "ABCD"
+# Serial.setTimeout(100)
+TIMEOUT = 0.1
+
+
+class EmulatedSerial:
+    """The board's end of the serial line, over a pseudo-terminal.
+
+    Bytes written to the terminal are delivered no faster than the baudrate
+    allows, and so are replies.
+    """
+
+    def __init__(self, fd: int, baudrate: int = 9600) -> None:
+        """Initialise the object.
+
+        Args:
+            fd (int): File descriptor of the pseudo-terminal's master end.
+            baudrate (int, optional): Baudrate to model. Defaults to 9600.
+        """
+        self._fd = fd
+        self.byte_time = 10 / baudrate
+        # Bytes received, with the time at which each finishes arriving.
+        self._rx: deque[tuple[float, int]] = deque()
+        self._rx_free = 0.0
+        # Bytes to send, with the time at which each has been sent.
+        self._tx: deque[tuple[float, int]] = deque()
+        self._tx_free = 0.0
+
+    def next_event(self) -> Optional[float]:
+        """Get the time at which the next byte arrives or is sent, if any."""
+        times = [queue[0][0] for queue in (self._rx, self._tx) if queue]
+        return min(times) if times else None
+
+    def poll(self, timeout: float) -> None:
+        """Take any bytes written to the terminal, waiting up to timeout.
+
+        Pending replies are sent as they fall due.
+        """
+        self._send()
+        readable, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        now = time.monotonic()
+        if readable:
+            for byte in os.read(self._fd, 1024):
+                self._rx_free = max(self._rx_free, now) + self.byte_time
+                self._rx.append((self._rx_free, byte))
+        self._send()
+
+    def available(self) -> bool:
+        """Whether a byte has finished arriving (`Serial.available`)."""
+        self.poll(0)
+        return bool(self._rx) and self._rx[0][0] <= time.monotonic()
+
+    def peek(self, timeout: float = TIMEOUT) -> Optional[int]:
+        """Wait for the next byte without consuming it (`timedPeek`).
+
+        Returns:
+            Optional[int]: The byte, or None if the timeout passed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if self._rx and self._rx[0][0] <= now:
+                return self._rx[0][1]
+            if now >= deadline:
+                return None
+            due = self._rx[0][0] if self._rx else deadline
+            self.poll(min(due, deadline) - now)
+
+    def read(self, timeout: float = TIMEOUT) -> Optional[int]:
+        """Wait for the next byte and consume it (`timedRead`).
+
+        Returns:
+            Optional[int]: The byte, or None if the timeout passed.
+        """
+        byte = self.peek(timeout)
+        if byte is not None:
+            self._rx.popleft()
+        return byte
+
+    def write(self, data: bytes) -> None:
+        """Queue bytes to be sent, as the board's transmit buffer does."""
+        for byte in data:
+            self._tx_free = (max(self._tx_free, time.monotonic())
+                             + self.byte_time)
+            self._tx.append((self._tx_free, byte))
+
+    def _send(self) -> None:
+        """Send the queued bytes that are due."""
+        now = time.monotonic()
+        data = bytearray()
+        while self._tx and self._tx[0][0] <= now:
+            data.append(self._tx.popleft()[1])
+        if data:
+            os.write(self._fd, data)
+
+
+class Controller:
+    """The controller's firmware."""
+
+    def __init__(self, serial: EmulatedSerial, verbose: bool = False) -> None:
+        """Initialise the object, with every relay off and not pulsing.
+
+        Args:
+            serial (EmulatedSerial): The serial line.
+            verbose (bool, optional): Whether to log commands as well as relay
+                transitions. Defaults to False.
+        """
+        self._serial = serial
+        self._verbose = verbose
+        self._start = time.monotonic()
+        self.pins = [False] * 4
+        self.last_pulse = [0] * 4
+        self.pulse_interval = [0] * 4
+
+    def millis(self) -> int:
+        """Get the milliseconds since the board started (`millis`)."""
+        return int((time.monotonic() - self._start) * 1000)
+
+    def run(self) -> None:
+        """Run the firmware until interrupted."""
+        while True:
+            self.loop()
+            if self._serial.available():
+                self.serial_event()
+            else:
+                self._serial.poll(self._idle_time())
+
+    def loop(self) -> None:
+        """Pulse the relays that are due (`loop`)."""
+        for i in range(4):
+            if (self.pulse_interval[i] > 0
+                    and self.millis() - self.last_pulse[i]
+                    >= self.pulse_interval[i]):
+                self.digital_write(i, not self.pins[i])
+                self.last_pulse[i] = self.millis()
+
+    def serial_event(self) -> None:
+        """Read and act on a command (`serialEvent`)."""
+        command = self._serial.read()
+        relay = self._serial.read()
+        if relay is None or chr(relay) not in RELAYS:
+            self._log_command(command, relay, "ignored")
+            return
+        pin = RELAYS.index(chr(relay))
+        if command == ord('+'):
+            self.digital_write(pin, True)
+        elif command == ord('-'):
+            self.digital_write(pin, False)
+        elif command == ord('!'):
+            self.pulse_interval[pin] = self.parse_int()
+            self._log_command(command, relay, self.pulse_interval[pin])
+            return
+        elif command == ord('?'):
+            self._serial.write(b'1\r\n' if self.pins[pin] else b'0\r\n')
+        else:
+            self._log_command(command, relay, "ignored")
+            return
+        self._log_command(command, relay)
+
+    def parse_int(self) -> int:
+        """Read an integer as `Serial.parseInt` does.
+
+        Anything other than a digit or minus sign before the number is
+        skipped, and 0 is returned if nothing arrives within the timeout.
+        """
+        serial = self._serial
+        while True:
+            byte = serial.peek()
+            if byte is None:
+                return 0
+            if byte == ord('-') or ord('0') <= byte <= ord('9'):
+                break
+            serial.read()
+        value = 0
+        negative = False
+        while byte is not None and (byte == ord('-')
+                                    or ord('0') <= byte <= ord('9')):
+            if byte == ord('-'):
+                negative = True
+            else:
+                value = value * 10 + byte - ord('0')
+            serial.read()
+            byte = serial.peek()
+            if byte == ord('-'):
+                # Only a leading minus sign is part of the number.
+                break
+        return -value if negative else value
+
+    def digital_write(self, pin: int, state: bool) -> None:
+        """Set a relay, logging the transition if it changes."""
+        if self.pins[pin] != state:
+            self.pins[pin] = state
+            print(f'{time.monotonic():.6f} {RELAYS[pin]} '
+                  f'{"on" if state else "off"}', flush=True)
+
+    def _idle_time(self) -> float:
+        """Get how long to wait for input before the next thing is due."""
+        now = time.monotonic()
+        due = [now + TIMEOUT]
+        event = self._serial.next_event()
+        if event is not None:
+            due.append(event)
+        for i in range(4):
+            if self.pulse_interval[i] > 0:
+                due.append(self._start + (self.last_pulse[i]
+                                          + self.pulse_interval[i]) / 1000)
+        return max(min(due) - now, 0)
+
+    def _log_command(self,
+                     command: Optional[int],
+                     relay: Optional[int],
+                     detail: object = "") -> None:
+        """Log a command, if verbose."""
+        if self._verbose:
+            text = "".join(chr(b) for b in (command, relay) if b is not None)
+            print(f'{time.monotonic():.6f} command {text!r} {detail}'.rstrip(),
+                  flush=True)
+
+
+def main() -> None:
+    """Run the emulator."""
+    parser = argparse.ArgumentParser(
+        description="Emulate the Arduino controller on a pseudo-terminal.")
+    parser.add_argument("--baudrate", type=int, default=9600,
+                        help="baudrate to model (default: 9600)")
+    parser.add_argument("--link", default="",
+                        help="path at which to create a symlink to the "
+                             "terminal, for a predictable port name")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log commands as well as relay transitions")
+    args = parser.parse_args()
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    port = os.ttyname(slave)
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(port, args.link)
+        port = args.link
+    # The board's end is kept open, so that the terminal survives clients
+    # closing and reopening it.
+    print(f'Emulating the controller on {port}', file=sys.stderr, flush=True)
+    try:
+        Controller(EmulatedSerial(master, args.baudrate), args.verbose).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        os.close(slave)
+        os.close(master)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 """Entry-point for Wet Yourself Laughing."""
 
 import cmd
+import shlex
 from configparser import ConfigParser
 from configparser import Error as ConfigParserError
 
 import wysl
 import wysl.game
 from wysl.config import DEFAULT_CONFIG, validate_config
+from wysl.exceptions import (CameraError, ConfigError, MicrophoneError,
+                             ModelError)
+from wysl.pool import WorkerPool
+from wysl.replay import replay_expression, replay_laughter
 from wysl.setup import setup
 from wysl.utils import pprint_config
 
@@ -20,6 +25,8 @@ class WyslShell(cmd.Cmd):
 
     intro = f'{wysl.__name__}\nVersion {wysl.__version__}'
     prompt = '> '
+    # Detection processes kept warm between games (see [game] keep_warm).
+    pool = WorkerPool()
 
     def do_setup(self, arg: str) -> None:
         """Set the game up."""
@@ -38,8 +45,47 @@ class WyslShell(cmd.Cmd):
         with open("config.ini", "w") as file:
             config.write(file)
 
+    def do_replayexpression(self, arg: str) -> None:
+        """Replay a video file or image directory through expression detection.
+
+        If no path is given, the configured expression source is used.
+        """
+        try:
+            print(replay_expression(config, arg.strip()))
+        except (CameraError, ModelError, ConfigError) as e:
+            print(f'Replay failed: {e}')
+        except ConfigParserError:
+            print("The configuration is not valid.")
+
+    def do_replaylaughter(self, arg: str) -> None:
+        """Replay a WAV file or directory through laughter detection.
+
+        Usage: replaylaughter [source [labels]]. If no source is given, the
+        configured laughter source is used. If no label file is given, each
+        WAV file's labels are read from a text file of the same name, if any.
+        """
+        try:
+            args = shlex.split(arg)
+        except ValueError as e:
+            print(f'Invalid arguments: {e}')
+            return
+        if len(args) > 2:
+            print("Usage: replaylaughter [source [labels]]")
+            return
+        try:
+            print(replay_laughter(config, *args))
+        except (MicrophoneError, ConfigError) as e:
+            print(f'Replay failed: {e}')
+        except ConfigParserError:
+            print("The configuration is not valid.")
+
+    def do_stats(self, arg: str) -> None:
+        """Show timing statistics from the most recent game."""
+        print(wysl.game.get_stats())
+
     def do_exit(self, arg: str) -> bool:
         """Exit the game."""
+        self.pool.close()
         return True
 
     def do_play(self, arg: str) -> None:
@@ -49,7 +95,7 @@ class WyslShell(cmd.Cmd):
         except ConfigParserError:
             print("The configuration is not valid.")
         else:
-            wysl.game.game_loop(config)
+            wysl.game.game_loop(config, self.pool)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,38 @@
+"""Tests of the expression inference backends."""
+
+import pytest
+
+pytest.importorskip("fer")
+
+import numpy as np  # noqa: E402
+from wysl.backends import FERBackend  # noqa: E402
+
+# A box that isn't square, and (last, as FER keeps the padded image for any
+# faces after it) one whose margin runs off the top left of the frame.
+BOXES = [[100, 60, 50, 80], [2, 3, 60, 60]]
+
+
+@pytest.fixture(scope="module")
+def backend() -> FERBackend:
+    return FERBackend()
+
+
+@pytest.fixture
+def frame() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (240, 320, 3),
+                                             dtype=np.uint8)
+
+
+def test_batched_matches_fer(backend: FERBackend, frame: np.ndarray) -> None:
+    expected = backend._detector.detect_emotions(frame, BOXES)
+    actual = backend.detect_emotions(frame, BOXES)
+    assert [e['box'] for e in actual] == [list(e['box']) for e in expected]
+    for got, want in zip(actual, expected):
+        assert got['emotions'] == pytest.approx(want['emotions'], abs=0.011)
+
+
+def test_falls_back_to_fer(backend: FERBackend, frame: np.ndarray,
+                           monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(backend, "_model", None)
+    assert (backend.detect_emotions(frame, BOXES)
+            == backend._detector.detect_emotions(frame, BOXES))
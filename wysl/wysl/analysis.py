@@ -0,0 +1,188 @@
+"""Audio analysis.
+
+Vectorised replacements for the `audioop` functions the game used to rely on
+(`audioop` was removed in Python 3.13). Raw audio is viewed in place with
+`np.frombuffer` rather than copied, and features are computed for a whole
+block of chunks at once, one value per chunk.
+
+For the spectral laughter detector, there are also short-time band energies
+(over overlapping, windowed frames) and the modulation spectrum of such an
+envelope, which shows how rhythmic the sound is.
+"""
+
+from typing import NamedTuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+# NumPy types of signed little-endian PCM samples, by sample width in bytes.
+SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+class ChunkFeatures(NamedTuple):
+    """Features of a block of audio chunks, with one value per chunk.
+
+    Attributes:
+        rms (ndarray): Root-mean-square amplitude, as `audioop.rms` gives.
+        peak (ndarray): Greatest absolute amplitude, as `audioop.max` gives.
+        zero_crossings (ndarray): Fraction of consecutive samples that change
+            sign. Voiced sounds have a low rate and noise a high one.
+    """
+
+    rms: ndarray
+    peak: ndarray
+    zero_crossings: ndarray
+
+
+def as_samples(data: Union[bytes, ndarray], sample_width: int = 2) -> ndarray:
+    """View raw audio as an array of samples, without copying it.
+
+    Args:
+        data (Union[bytes, ndarray]): Raw PCM audio, or samples already.
+        sample_width (int, optional): Width of each sample, in bytes.
+            Defaults to 2.
+
+    Raises:
+        ValueError: If the sample width isn't supported.
+
+    Returns:
+        ndarray: The samples.
+    """
+    if isinstance(data, ndarray):
+        return data
+    try:
+        dtype = SAMPLE_TYPES[sample_width]
+    except KeyError:
+        raise ValueError(f'Unsupported sample width {sample_width}.') from None
+    return np.frombuffer(data, dtype=dtype)
+
+
+def as_chunks(samples: ndarray, chunk_size: int) -> ndarray:
+    """View samples as a 2D array with one chunk per row.
+
+    Any samples left over after the last whole chunk are ignored.
+    """
+    chunks = len(samples) // chunk_size
+    return samples[:chunks * chunk_size].reshape(chunks, chunk_size)
+
+
+def chunk_features(samples: ndarray, chunk_size: int) -> ChunkFeatures:
+    """Compute the features of every chunk in a block of samples.
+
+    Args:
+        samples (ndarray): Samples, e.g. from `as_samples`.
+        chunk_size (int): Number of samples per chunk.
+
+    Returns:
+        ChunkFeatures: The features of each whole chunk.
+    """
+    chunks = as_chunks(samples, chunk_size)
+    squares = np.square(chunks, dtype=np.float64)
+    signs = np.signbit(chunks)
+    return ChunkFeatures(
+        rms=np.sqrt(squares.mean(axis=1)),
+        peak=np.abs(chunks.astype(np.int64)).max(axis=1, initial=0),
+        zero_crossings=(signs[:, 1:] != signs[:, :-1]).mean(axis=1))
+
+
+def band_energies(samples: ndarray,
+                  rate: int,
+                  frame_size: int,
+                  hop: int,
+                  band: tuple[float, float]) -> ndarray:
+    """Compute the energy in a frequency band over overlapping frames.
+
+    Each frame is Hann windowed, and all frames are transformed at once.
+
+    Args:
+        samples (ndarray): Samples. Any left over after the last whole frame
+            are ignored.
+        rate (int): Sample rate, in Hz.
+        frame_size (int): Number of samples per frame.
+        hop (int): Number of samples between the starts of successive frames.
+        band (tuple[float, float]): Lower (inclusive) and upper (exclusive)
+            edges of the band, in Hz.
+
+    Returns:
+        ndarray: The energy in the band, one value per frame.
+    """
+    if len(samples) < frame_size:
+        return np.zeros(0)
+    starts = np.arange(0, len(samples) - frame_size + 1, hop)
+    frames = samples[starts[:, np.newaxis] + np.arange(frame_size)]
+    spectrum = np.fft.rfft(frames * np.hanning(frame_size), axis=1)
+    freqs = np.fft.rfftfreq(frame_size, 1 / rate)
+    mask = (freqs >= band[0]) & (freqs < band[1])
+    return np.square(np.abs(spectrum[:, mask])).sum(axis=1)
+
+
+def modulation_ratio(envelope: ndarray,
+                     rate: float,
+                     band: tuple[float, float],
+                     total: tuple[float, float]) -> float:
+    """Compute how much of an envelope's modulation lies in a band.
+
+    Args:
+        envelope (ndarray): Envelope of a signal, e.g. from `band_energies`.
+        rate (float): Rate at which the envelope is sampled, in Hz.
+        band (tuple[float, float]): Modulation frequencies of interest, in Hz.
+        total (tuple[float, float]): Range of modulation frequencies against
+            which to compare the band, in Hz.
+
+    Returns:
+        float: Energy of the modulation in the band as a fraction of that in
+            the total range, between 0 and 1.
+    """
+    spectrum = np.fft.rfft((envelope - envelope.mean())
+                           * np.hanning(len(envelope)))
+    power = np.square(np.abs(spectrum))
+    freqs = np.fft.rfftfreq(len(envelope), 1 / rate)
+    in_total = (freqs >= total[0]) & (freqs <= total[1])
+    in_band = (freqs >= band[0]) & (freqs <= band[1])
+    denominator = power[in_total].sum()
+    if denominator <= 0:
+        return 0.0
+    return float(power[in_band & in_total].sum() / denominator)
+
+
+class OverlappingWindows:
+    """Analysis windows that overlap, over a stream of hops.
+
+    Audio arrives one hop at a time, but each analysis covers the last
+    `window` samples, so features can be updated as often as every hop
+    without shortening the window over which they're measured. The tail of
+    each block is kept to complete the windows of the next.
+    """
+
+    def __init__(self, window: int, hop: int) -> None:
+        """Initialise the object.
+
+        Args:
+            window (int): Number of samples per analysis window.
+            hop (int): Number of samples between the ends of successive
+                windows. Must not be greater than window.
+        """
+        self.window = window
+        self.hop = hop
+        self.clear()
+
+    def rms(self, samples: ndarray) -> ndarray:
+        """Compute the RMS of each window ending at a hop of new samples.
+
+        Args:
+            samples (ndarray): New samples, a whole number of hops long.
+
+        Returns:
+            ndarray: The RMS of the window ending with each hop.
+        """
+        audio = np.concatenate((self._history, samples))
+        self._history = audio[len(audio) - (self.window - self.hop):]
+        energy = np.concatenate(
+            ([0.0], np.cumsum(np.square(audio, dtype=np.float64))))
+        ends = np.arange(self.window, len(audio) + 1, self.hop)
+        return np.sqrt(np.maximum(energy[ends] - energy[ends - self.window],
+                                  0.0) / self.window)
+
+    def clear(self) -> None:
+        """Forget the history, as at the start of a stream."""
+        self._history = np.zeros(self.window - self.hop, dtype=np.int16)
@@ -1,29 +1,340 @@
 """Arduino communication game component.
 
 Communication with the arduino is handled by `arduino_loop`, which should be
-run as a thread.
+run as a thread. It blocks on its queue while there is nothing to send, so
+it costs no CPU while the game is idle.
+
+At 9600 baud, every byte sent to the controller takes about a millisecond,
+so redundant commands (such as re-sending the pulse interval a channel is
+already pulsing at) delay the ones that matter. A `RelayState` keeps a
+shadow copy of the relays, with which the commands waiting in the queue are
+coalesced into a single write.
+
+Commands that switch EMS off or squeeze the balloon can't wait behind a
+backlog of tickle updates, so an `ArduinoQueue` has a second, urgent lane.
+Urgent commands are taken before anything else, and written (and flushed)
+on their own before the rest. They are never dropped as redundant.
+
+The controller answers `?<relay>` queries with the relay's state, in the
+order they were sent. A `QueryTracker` matches the replies up with the
+queries, which are sent on request (`CommandEnum.QUERY_CHANNEL`) and
+periodically for every relay that isn't pulsing, to check that the relays
+are in the state we think they are. Relays found on when they should be off
+are switched off; other mismatches are only logged, as switching EMS on
+unbidden would be worse than leaving it off. This also measures the round
+trip time to the controller.
 """
 import multiprocessing as mp
-from queue import Empty
+import time
+from collections import deque
+from queue import Queue
+from typing import Iterable, NamedTuple, Optional, Sequence
 
 import serial
 
-from .enums import CommandEnum, ErrorEnum
+from .enums import ChannelEnum, CommandEnum, ErrorEnum
+from .instrumentation import NO_INSTRUMENTATION, Instrumentation
 from .types import ITCQueue, Payload
 
 logger = mp.get_logger()
 
+# How often to check for replies while queries are awaiting them, in seconds.
+REPLY_POLL_INTERVAL = 0.002
+
+
+class QueuedCommand(NamedTuple):
+    """A command, the time at which it was queued, and whether it's urgent."""
+
+    payload: Payload
+    queued_at: float
+    urgent: bool
+
+
+class QueryReply(NamedTuple):
+    """The reply to a relay query.
+
+    Attributes:
+        channel (ChannelEnum): The relay queried.
+        state (bool): Whether the relay is on.
+        expected (Optional[bool]): Whether the relay was meant to be on when
+            the query was sent, or None if unknown.
+        rtt (float): Time from sending the query to receiving the reply, in
+            seconds.
+    """
+
+    channel: ChannelEnum
+    state: bool
+    expected: Optional[bool]
+    rtt: float
+
+
+class QueryTracker:
+    """Matches replies from the controller with the queries sent to it.
+
+    The controller replies to queries in order, so queries are kept in a
+    FIFO. If a reply doesn't come within the timeout, the replies can no
+    longer be trusted to line up, so all queries in flight are abandoned.
+
+    Attributes:
+        timeouts (int): Number of queries abandoned.
+    """
+
+    def __init__(self, timeout: float = 1.0) -> None:
+        """Initialise the object.
+
+        Args:
+            timeout (float, optional): Time, in seconds, to wait for each
+                reply. Defaults to 1.0.
+        """
+        self.timeout = timeout
+        self.timeouts = 0
+        self._pending: deque[tuple[ChannelEnum, Optional[bool], float]] = (
+            deque())
+        self._buffer = b''
+
+    @property
+    def pending(self) -> int:
+        """Number of queries awaiting a reply."""
+        return len(self._pending)
+
+    def expect(self,
+               channel: ChannelEnum,
+               expected: Optional[bool],
+               sent_at: float) -> None:
+        """Note that a query has been sent.
+
+        Args:
+            channel (ChannelEnum): The relay queried.
+            expected (Optional[bool]): Whether the relay should be on, or None
+                if unknown.
+            sent_at (float): Time (as returned by `time.monotonic`) at which
+                the query was sent.
+        """
+        self._pending.append((channel, expected, sent_at))
+
+    def feed(self, data: bytes, now: float) -> list[QueryReply]:
+        """Take data read from the controller.
+
+        Args:
+            data (bytes): The data, which may end part way through a reply.
+            now (float): Time (as returned by `time.monotonic`) at which it
+                was read.
+
+        Returns:
+            list[QueryReply]: The replies completed by the data.
+        """
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        replies = []
+        for line in lines:
+            line = line.strip()
+            if line not in (b'0', b'1'):
+                logger.warning("Unexpected reply from the controller: %r",
+                               line)
+                continue
+            if not self._pending:
+                logger.warning("Unsolicited reply from the controller.")
+                continue
+            channel, expected, sent_at = self._pending.popleft()
+            replies.append(QueryReply(channel, line == b'1', expected,
+                                      now - sent_at))
+        return replies
+
+    def expire(self, now: float) -> bool:
+        """Abandon all queries if the oldest has timed out.
+
+        Returns:
+            bool: Whether the queries were abandoned, in which case any
+                partial reply should be discarded too.
+        """
+        if not self._pending or now - self._pending[0][2] < self.timeout:
+            return False
+        self.timeouts += len(self._pending)
+        self._pending.clear()
+        self._buffer = b''
+        return True
+
+
+def command_channel(payload: Payload) -> Optional[ChannelEnum]:
+    """Get the channel a relay command is for, or None if it isn't one."""
+    if payload.payload == CommandEnum.PULSE_CHANNEL:
+        return payload.others[0]
+    elif (payload.payload == CommandEnum.CHANNEL_ON
+            or payload.payload == CommandEnum.CHANNEL_OFF):
+        return payload.others
+    return None
+
+
+class ArduinoQueue(Queue[Payload]):
+    """Queue of commands for the Arduino thread, with an urgent lane.
+
+    It can be used as an ordinary queue, in which case urgent commands are
+    got before any others. The Arduino thread instead takes everything
+    queued at once with `take`, which also tells it when each command was
+    queued.
+    """
+
+    def put_urgent(self, item: Payload) -> None:
+        """Queue a command ahead of all non-urgent ones.
+
+        Any non-urgent commands still waiting for the same channel are
+        dropped, as this one supersedes them.
+        """
+        channel = command_channel(item)
+        with self.not_empty:
+            if channel is not None:
+                kept = [command for command in self.queue
+                        if command_channel(command.payload) is not channel]
+                self.unfinished_tasks -= len(self.queue) - len(kept)
+                self.queue = deque(kept)
+            self._urgent.append(QueuedCommand(item, time.monotonic(), True))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
 
-def arduino_loop(queue: ITCQueue,
+    def take(self, timeout: Optional[float] = None) -> list[QueuedCommand]:
+        """Wait for commands, then take all that are queued.
+
+        Args:
+            timeout (Optional[float], optional): Maximum time to wait, in
+                seconds. If None, wait indefinitely. Defaults to None.
+
+        Returns:
+            list[QueuedCommand]: The commands, urgent ones first, in the order
+                they were queued. Empty if the timeout passed.
+        """
+        with self.not_empty:
+            self.not_empty.wait_for(self._qsize, timeout)
+            commands = [*self._urgent, *self.queue]
+            self._urgent.clear()
+            self.queue.clear()
+            self.not_full.notify_all()
+            return commands
+
+    def _init(self, maxsize: int) -> None:
+        """Initialise the lanes."""
+        super()._init(maxsize)
+        self._urgent: deque[QueuedCommand] = deque()
+
+    def _qsize(self) -> int:
+        """Get the number of commands in both lanes."""
+        return len(self._urgent) + len(self.queue)
+
+    def _put(self, item: Payload) -> None:
+        """Queue a non-urgent command."""
+        self.queue.append(QueuedCommand(item, time.monotonic(), False))
+
+    def _get(self) -> Payload:
+        """Get the next command, from the urgent lane if it isn't empty."""
+        lane = self._urgent if self._urgent else self.queue
+        return lane.popleft().payload
+
+
+class RelayState:
+    """Shadow copy of the state and pulse interval of each relay.
+
+    The state of a relay is unknown while it is pulsing, and after pulsing is
+    stopped (the controller doesn't guarantee it), so switching it on or off
+    is never dropped then.
+
+    Attributes:
+        dropped (int): Number of commands that were superseded or would have
+            had no effect, and so weren't sent.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the object, with every relay off and not pulsing."""
+        self._on: dict[ChannelEnum, Optional[bool]] = {
+            channel: False for channel in ChannelEnum}
+        self._interval = {channel: 0 for channel in ChannelEnum}
+        self.dropped = 0
+
+    def state(self, channel: ChannelEnum) -> Optional[bool]:
+        """Whether a relay should be on, or None if unknown."""
+        return self._on[channel]
+
+    def encode(self,
+               commands: Iterable[Payload],
+               force: bool = False) -> bytes:
+        """Coalesce relay commands into a single message.
+
+        Only the latest pulse command and the latest on/off command for each
+        channel are kept, and those that wouldn't change anything are dropped.
+        Pulse commands are sent before on/off commands.
+
+        Args:
+            commands (Iterable[Payload]): The commands, in the order they
+                were queued.
+            force (bool, optional): Whether to send the commands kept even if
+                the shadow copy says they wouldn't change anything, for those
+                that must get through whatever state the relays are really
+                in. Defaults to False.
+
+        Returns:
+            bytes: The message to send, which may be empty.
+        """
+        pulses: dict[ChannelEnum, int] = {}
+        states: dict[ChannelEnum, bool] = {}
+        count = 0
+        for payload, other in commands:
+            if payload == CommandEnum.PULSE_CHANNEL:
+                pulses[other[0]] = int(other[1])
+            elif (payload == CommandEnum.CHANNEL_ON
+                    or payload == CommandEnum.CHANNEL_OFF):
+                states[other] = payload == CommandEnum.CHANNEL_ON
+            else:
+                continue
+            count += 1
+
+        msg = ''
+        for channel in ChannelEnum:
+            interval = pulses.get(channel)
+            if interval is not None and (
+                    force or interval != self._interval[channel]):
+                msg += CommandEnum.PULSE_CHANNEL.value + channel.value
+                msg += str(interval)
+                self._interval[channel] = interval
+                self._on[channel] = None
+                count -= 1
+            on = states.get(channel)
+            if on is not None and (force or on is not self._on[channel]):
+                msg += (CommandEnum.CHANNEL_ON if on
+                        else CommandEnum.CHANNEL_OFF).value + channel.value
+                self._on[channel] = on if not self._interval[channel] else None
+                count -= 1
+        self.dropped += count
+        return bytes(msg, encoding='ascii')
+
+
+def arduino_loop(queue: ArduinoQueue,
+                 errors: ITCQueue,
                  port: str,
-                 baudrate: int = 9600) -> None:
+                 baudrate: int = 9600,
+                 stats_interval: float = 10.0,
+                 timer: Instrumentation = NO_INSTRUMENTATION,
+                 verify_interval: float = 5.0) -> None:
     """Handle communication with the Arduino.
 
     Args:
-        queue (ITCQueue): Queue object to use for inter-thread communication.
+        queue (ArduinoQueue): Queue of commands to send to the Arduino.
+        errors (ITCQueue): Queue on which to report errors.
         port (str): Identifier of the port to which the Arduino is connected.
         baudrate (int, optional): Baudrate of the connection to establish.
             Defaults to 9600.
+        stats_interval (float, optional): Interval, in seconds, at which to
+            update the thread's gauges: its CPU usage ("arduino_cpu", as a
+            percentage of one core), the number of relay commands dropped
+            ("relay_commands_dropped"), and the number of relays found in the
+            wrong state ("relay_mismatches") and of queries that went
+            unanswered ("query_timeouts"). Set to 0 to disable them.
+            Defaults to 10.0.
+        timer (Instrumentation, optional): Instrumentation on which to set the
+            gauges, and record the time from queueing each relay command to
+            writing it ("relay_urgent" for urgent commands, "relay" for
+            others) and the round trip time of queries ("relay_rtt").
+            Defaults to NO_INSTRUMENTATION.
+        verify_interval (float, optional): Interval, in seconds, at which to
+            query the relays that aren't pulsing, and switch off any that are
+            on when they should be off. Set to 0 to disable it.
+            Defaults to 5.0.
     """
     logger.info("Port: %s, baudrate: %d", port, baudrate)
 
@@ -37,29 +348,123 @@ def arduino_loop(queue: ITCQueue,
                             dsrdtr=True)
     except (ValueError, serial.SerialException) as e:
         logger.error(e)
-        queue.put_nowait(Payload(ErrorEnum.SERIAL_ERROR))
+        errors.put_nowait(Payload(ErrorEnum.SERIAL_ERROR))
         exit()
 
     # Disable pulsing of relays and turn all relays off.
     ser.write(b'!A0!B0!C0!D0-A-B-C-D')
+    relays = RelayState()
+    queries = QueryTracker()
+    mismatches = 0
+    measure = timer.enabled and stats_interval > 0
+    last_wall, last_cpu = time.monotonic(), time.thread_time()
+    next_report = last_wall + stats_interval
+    next_sweep = last_wall + verify_interval
     while True:
-        try:
-            payload, other = queue.get(block=False)
-            msg = ''
-            if payload == CommandEnum.TERMINATE:
-                break
-            elif (payload == CommandEnum.CHANNEL_ON
-                    or payload == CommandEnum.CHANNEL_OFF):
-                msg += payload.value + other.value
-            elif payload == CommandEnum.PULSE_CHANNEL:
-                msg += payload.value + other[0].value + str(other[1])
-            else:
-                pass
-            ser.write(bytes(msg, encoding='ascii'))
-        except Empty:
-            continue
+        now = time.monotonic()
+        deadlines = []
+        if measure:
+            if now >= next_report:
+                cpu = time.thread_time()
+                timer.gauge("arduino_cpu",
+                            100 * (cpu - last_cpu) / (now - last_wall))
+                timer.gauge("relay_commands_dropped", relays.dropped)
+                timer.gauge("relay_mismatches", mismatches)
+                timer.gauge("query_timeouts", queries.timeouts)
+                last_wall, last_cpu = now, cpu
+                next_report = now + stats_interval
+            deadlines.append(next_report)
+        if verify_interval > 0:
+            if now >= next_sweep:
+                # Relays that are pulsing can't be checked.
+                send_queries(ser, queries, relays,
+                             [channel for channel in ChannelEnum
+                              if relays.state(channel) is not None])
+                next_sweep = now + verify_interval
+            deadlines.append(next_sweep)
+        if queries.pending:
+            # Check for replies often, without spinning.
+            deadlines.append(now + REPLY_POLL_INTERVAL)
+
+        # Sleep until there are commands or something else is due, then take
+        # everything that's waiting, so it can be coalesced.
+        timeout = max(min(deadlines) - now, 0) if deadlines else None
+        commands = queue.take(timeout)
+
+        # Handle replies, without waiting for them.
+        now = time.monotonic()
+        replies = queries.feed(ser.read(ser.in_waiting), now)
+        if queries.expire(now):
+            logger.warning("The controller stopped answering queries.")
+            ser.reset_input_buffer()
+        for reply in replies:
+            timer.record("relay_rtt", reply.rtt)
+            logger.debug("Relay %s is %s", reply.channel.value,
+                         "on" if reply.state else "off")
+            if reply.expected is None or reply.state == reply.expected:
+                continue
+            mismatches += 1
+            logger.warning("Relay %s is %s, but should be %s",
+                           reply.channel.value,
+                           "on" if reply.state else "off",
+                           "on" if reply.expected else "off")
+            # Switch it off if it should be, unless it has been changed since.
+            # A relay that should be on is left alone.
+            if (reply.expected is False
+                    and relays.state(reply.channel) is False):
+                ser.write(bytes(CommandEnum.CHANNEL_OFF.value
+                                + reply.channel.value, encoding='ascii'))
+
+        urgent = [command for command in commands if command.urgent]
+        if urgent:
+            # Get these to the controller before anything else, and never
+            # drop them: switching EMS off must work even if the shadow copy
+            # is wrong.
+            msg = relays.encode((command.payload for command in urgent),
+                                force=True)
+            if msg:
+                ser.write(msg)
+                ser.flush()
+            record_latencies(timer, "relay_urgent", urgent)
+        if any(command.payload.payload == CommandEnum.TERMINATE
+               for command in commands):
+            break
+        others = [command for command in commands if not command.urgent]
+        msg = relays.encode(command.payload for command in others)
+        if msg:
+            ser.write(msg)
+        record_latencies(timer, "relay", others)
+        # Queries go last, so that they see the commands before them.
+        send_queries(ser, queries, relays,
+                     [command.payload.others for command in commands
+                      if command.payload.payload
+                      == CommandEnum.QUERY_CHANNEL])
 
     # Cleanup
     # Disable pulsing of relays and turn all relays off.
     ser.write(b'!A0!B0!C0!D0-A-B-C-D')
     ser.close()
+
+
+def send_queries(ser: serial.Serial,
+                 queries: QueryTracker,
+                 relays: RelayState,
+                 channels: Sequence[ChannelEnum]) -> None:
+    """Query the state of some relays, in a single write."""
+    if not channels:
+        return
+    ser.write(bytes("".join(CommandEnum.QUERY_CHANNEL.value + channel.value
+                            for channel in channels), encoding='ascii'))
+    now = time.monotonic()
+    for channel in channels:
+        queries.expect(channel, relays.state(channel), now)
+
+
+def record_latencies(timer: Instrumentation,
+                     stage: str,
+                     commands: Iterable[QueuedCommand]) -> None:
+    """Record the time from queueing each relay command until now."""
+    now = time.monotonic()
+    for command in commands:
+        if command_channel(command.payload) is not None:
+            timer.record(stage, now - command.queued_at)
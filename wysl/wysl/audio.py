@@ -0,0 +1,384 @@
+"""Audio capture game component.
+
+Audio is captured with PyAudio in callback mode: PortAudio calls
+`AudioCapture.callback` from its own thread as each buffer arrives, and the
+callback copies the samples into a preallocated ring buffer. The laughter
+detector consumes the ring buffer at its own pace, so a slow redraw of the
+waveform plot delays detection but doesn't lose audio.
+
+The ring buffer has exactly one writer (the callback) and one reader (the
+detection loop). Each side only ever advances its own position, and publishes
+it with a single attribute assignment once the samples are in place, so
+neither side needs to take a lock.
+
+Besides microphones, WAV files and directories of WAV files can be used as
+audio sources (see `read_wave_source`), so that the laughter pipeline can be
+run on recorded sessions. A `WaveStream` plays a recording into the ring
+buffer in real time, in place of a PyAudio stream.
+"""
+
+import multiprocessing as mp
+import threading
+import time
+import wave
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pyaudio
+from numpy import ndarray
+
+from .exceptions import MicrophoneError
+
+logger = mp.get_logger()
+
+
+class AudioCapture:
+    """Ring-buffered audio capture stage.
+
+    Attributes:
+        captured (int): Number of samples written to the ring buffer.
+        consumed (int): Number of samples handed out by `read`.
+        overflows (int): Number of input buffers lost, either because the ring
+            buffer was full or because PortAudio reported an input overflow.
+        underruns (int): Number of times the passthrough output ran dry (as
+            reported by PortAudio), or `read` timed out waiting for audio.
+    """
+
+    def __init__(self,
+                 rate: int,
+                 chunk_size: int,
+                 capacity: int,
+                 passthrough: bool = True,
+                 timeout: float = 1.0) -> None:
+        """Initialise the object.
+
+        Args:
+            rate (int): Sample rate of the stream, in Hz.
+            chunk_size (int): Number of samples handed out by each `read`.
+            capacity (int): Size of the ring buffer, in samples. It is rounded
+                up to a whole number of chunks.
+            passthrough (bool, optional): Whether the callback should return
+                the captured audio for playback. Defaults to True.
+            timeout (float, optional): How long `read` waits for audio before
+                giving up. Defaults to 1.0.
+        """
+        self.rate = rate
+        self.chunk_size = chunk_size
+        chunks = max(-(-capacity // chunk_size), 2)
+        self._buffer = np.zeros(chunks * chunk_size, dtype=np.int16)
+        self._passthrough = passthrough
+        self._timeout = timeout
+        # (samples written, time.monotonic() of the last write), published by
+        # the callback as a single tuple so the two always agree.
+        self._head: tuple[int, float] = (0, 0.0)
+        # Samples read, published by the consumer.
+        self._tail = 0
+        self._data_ready = threading.Event()
+        # Set by the writer once its source has no more audio to give.
+        self._ended = False
+        self.overflows = 0
+        self.underruns = 0
+
+    @property
+    def captured(self) -> int:
+        """Number of samples written to the ring buffer."""
+        return self._head[0]
+
+    @property
+    def consumed(self) -> int:
+        """Number of samples handed out by `read`."""
+        return self._tail
+
+    @property
+    def backlog(self) -> int:
+        """Number of samples waiting to be read."""
+        return self._head[0] - self._tail
+
+    def callback(self,
+                 in_data: Optional[bytes],
+                 frame_count: int,
+                 time_info: Any,
+                 status_flags: int) -> tuple[Optional[bytes], int]:
+        """PyAudio stream callback.
+
+        Pass this as `stream_callback` to `pyaudio.PyAudio.open`. The stream
+        must be 16-bit mono.
+        """
+        if status_flags & pyaudio.paInputOverflow:
+            self.overflows += 1
+        if status_flags & pyaudio.paOutputUnderflow:
+            self.underruns += 1
+        if in_data is not None:
+            self.write(np.frombuffer(in_data, dtype=np.int16))
+        if not self._passthrough:
+            return None, pyaudio.paContinue
+        return in_data, pyaudio.paContinue
+
+    def write(self, samples: ndarray) -> None:
+        """Copy samples into the ring buffer (writer side).
+
+        This is called by `callback`, and must only be called by one thread.
+        """
+        written, _ = self._head
+        size = len(self._buffer)
+        if written + len(samples) - self._tail > size:
+            # The reader has fallen a whole buffer behind. Drop the newest
+            # audio rather than overwrite audio that may be being read.
+            self.overflows += 1
+            return
+        start = written % size
+        end = start + len(samples)
+        if end <= size:
+            self._buffer[start:end] = samples
+        else:
+            split = size - start
+            self._buffer[start:] = samples[:split]
+            self._buffer[:end - size] = samples[split:]
+        self._head = (written + len(samples), time.monotonic())
+        self._data_ready.set()
+
+    def end(self) -> None:
+        """Mark the source as finished (writer side).
+
+        Once the remaining audio has been read, `read` raises EOFError
+        rather than waiting for more.
+        """
+        self._ended = True
+        self._data_ready.set()
+
+    def available(self) -> int:
+        """Number of whole chunks waiting to be read."""
+        return self.backlog // self.chunk_size
+
+    def read(self, chunks: int = 1) -> tuple[ndarray, float]:
+        """Get the oldest audio that has not yet been consumed.
+
+        Blocks until the requested number of whole chunks is available. If
+        the source has ended, whatever whole chunks remain are returned
+        instead.
+
+        Args:
+            chunks (int, optional): Number of chunks to read. Reading all of
+                the available chunks at once allows them to be analysed
+                together. Defaults to 1.
+
+        Raises:
+            MicrophoneError: If the audio didn't arrive within the timeout.
+            EOFError: If the source has ended and all of its audio has been
+                read.
+
+        Returns:
+            tuple[ndarray, float]: The samples, and the time (as returned by
+                `time.monotonic`) at which the last of them was captured.
+        """
+        size = len(self._buffer)
+        chunks = min(max(chunks, 1), size // self.chunk_size)
+        deadline = time.monotonic() + self._timeout
+        while self.available() < chunks:
+            self._data_ready.clear()
+            # Check again, in case the callback wrote between the test above
+            # and clearing the event.
+            if self.available() >= chunks:
+                break
+            if self._ended:
+                chunks = self.available()
+                if chunks == 0:
+                    raise EOFError("The audio source has ended.")
+                break
+            if not self._data_ready.wait(deadline - time.monotonic()):
+                self.underruns += 1
+                raise MicrophoneError("Timed out waiting for audio.")
+
+        written, written_at = self._head
+        start = self._tail % size
+        end = start + chunks * self.chunk_size
+        if end <= size:
+            samples = self._buffer[start:end].copy()
+        else:
+            samples = np.concatenate((self._buffer[start:],
+                                      self._buffer[:end - size]))
+        self._tail += chunks * self.chunk_size
+        captured_at = written_at - (written - self._tail) / self.rate
+        return samples, captured_at
+
+    def clear(self) -> None:
+        """Discard any audio waiting to be read (reader side)."""
+        written, _ = self._head
+        self._tail = written - written % self.chunk_size
+
+    def stats(self) -> str:
+        """Summarise the capture counters as a human-readable string."""
+        return (f'captured={self.captured} consumed={self.consumed} '
+                f'backlog={self.backlog} overflows={self.overflows} '
+                f'underruns={self.underruns}')
+
+
+class WaveStream:
+    """Stand-in for a PyAudio stream that plays a recording in real time.
+
+    Samples are handed to the consumer (usually `AudioCapture.write`) one
+    chunk at a time from a background thread, at the rate they were
+    recorded. Once the recording has been played, nothing more is written,
+    and the end of the recording is signalled with `on_end`, if given.
+    """
+
+    def __init__(self,
+                 samples: ndarray,
+                 rate: int,
+                 chunk_size: int,
+                 consumer: Callable[[ndarray], None],
+                 on_end: Optional[Callable[[], None]] = None) -> None:
+        """Initialise the object.
+
+        Args:
+            samples (ndarray): The recording, as 16-bit mono samples.
+            rate (int): Sample rate of the recording, in Hz.
+            chunk_size (int): Number of samples to write at a time.
+            consumer (Callable[[ndarray], None]): Function to which to pass
+                each chunk.
+            on_end (Optional[Callable[[], None]], optional): Function to call
+                once the whole recording has been played (usually
+                `AudioCapture.end`). Defaults to None.
+        """
+        self._samples = samples
+        self._period = chunk_size / rate
+        self._chunk_size = chunk_size
+        self._consumer = consumer
+        self._on_end = on_end
+        self._position = 0
+        self._running = True
+        self._active = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name="WaveThread",
+                                        daemon=True)
+
+    def start_stream(self) -> None:
+        """Start or resume playback."""
+        self._active.set()
+        if self._thread.ident is None:
+            self._thread.start()
+
+    def stop_stream(self) -> None:
+        """Pause playback."""
+        self._active.clear()
+
+    def is_active(self) -> bool:
+        """Whether the recording is being played."""
+        return self._active.is_set() and self._thread.is_alive()
+
+    def close(self) -> None:
+        """Stop playback for good."""
+        self._running = False
+        self._active.set()
+        if self._thread.is_alive():
+            self._thread.join(self._period * 2)
+
+    def _run(self) -> None:
+        """Playback thread body."""
+        next_write = time.monotonic()
+        while self._running and self._position < len(self._samples):
+            if not self._active.is_set():
+                self._active.wait()
+                next_write = time.monotonic()
+                continue
+            time.sleep(max(next_write - time.monotonic(), 0))
+            next_write += self._period
+            end = self._position + self._chunk_size
+            self._consumer(self._samples[self._position:end])
+            self._position = end
+        if self._position >= len(self._samples):
+            logger.info("Finished playing the recording.")
+            if self._on_end is not None:
+                self._on_end()
+
+
+def wave_files(source: str) -> list[Path]:
+    """List the WAV files in a source.
+
+    Args:
+        source (str): Path to a WAV file, or to a directory of them (which are
+            taken in name order).
+
+    Raises:
+        MicrophoneError: If the source doesn't exist or holds no WAV files.
+
+    Returns:
+        list[Path]: The files.
+    """
+    path = Path(source)
+    if path.is_dir():
+        files = sorted(p for p in path.iterdir()
+                       if p.suffix.casefold() == ".wav")
+    elif path.is_file():
+        files = [path]
+    else:
+        raise MicrophoneError(f'{source} does not exist.')
+    if not files:
+        raise MicrophoneError(f'There are no WAV files in {source}.')
+    return files
+
+
+def read_wave(path: Path) -> tuple[ndarray, int]:
+    """Read a WAV file as 16-bit mono samples.
+
+    Multi-channel recordings are mixed down, and other sample widths are
+    scaled to 16 bits.
+
+    Args:
+        path (Path): Path to the file.
+
+    Raises:
+        MicrophoneError: If the file can't be read.
+
+    Returns:
+        tuple[ndarray, int]: The samples, and the sample rate in Hz.
+    """
+    try:
+        with wave.open(str(path), "rb") as file:
+            channels = file.getnchannels()
+            width = file.getsampwidth()
+            rate = file.getframerate()
+            data = file.readframes(file.getnframes())
+    except (OSError, EOFError, wave.Error) as e:
+        raise MicrophoneError(f'Failed to read {path}: {e}') from e
+    if width == 1:
+        # 8-bit WAV is unsigned.
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+                   - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.int32)
+    elif width == 4:
+        samples = np.frombuffer(data, dtype="<i4") >> 16
+    else:
+        raise MicrophoneError(f'{path} has unsupported {width * 8}-bit '
+                              f'samples.')
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.int16), rate
+
+
+def read_wave_source(source: str) -> tuple[list[tuple[Path, ndarray]], int]:
+    """Read every WAV file in a source.
+
+    Args:
+        source (str): Path to a WAV file, or to a directory of them.
+
+    Raises:
+        MicrophoneError: If the files can't be read or their sample rates
+            differ.
+
+    Returns:
+        tuple[list[tuple[Path, ndarray]], int]: Each file with its samples,
+            and the sample rate in Hz.
+    """
+    recordings = []
+    rate = 0
+    for path in wave_files(source):
+        samples, file_rate = read_wave(path)
+        if rate and file_rate != rate:
+            raise MicrophoneError(f'{path} is sampled at {file_rate}Hz, but '
+                                  f'earlier files at {rate}Hz.')
+        rate = file_rate
+        recordings.append((path, samples))
+    return recordings, rate
@@ -0,0 +1,261 @@
+"""Expression inference backends.
+
+A backend finds faces in a frame and scores their expressions, returning the
+same list-of-dictionaries structure as FER. This allows the expression
+detection loop to be run without TensorFlow where that's too heavy.
+
+Classes:
+    ExpressionBackend: Base class of all backends.
+    FERBackend: Backend using FER (TensorFlow/Keras). The default.
+    DNNBackend: Lightweight CPU backend using a Haar cascade to find faces and
+        an exported emotion model run with OpenCV's DNN module.
+
+Functions:
+    crop_faces: Crop faces out of an image into a batch for an emotion model.
+    make_backend: Construct a backend by name.
+"""
+
+import multiprocessing as mp
+from typing import Any, Optional, Sequence
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from .types import FERList
+
+logger = mp.get_logger()
+
+# The order in which FER's emotion model (and models exported from it) emits
+# its scores.
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise',
+                  'neutral')
+
+
+def crop_faces(gray: ndarray,
+               boxes: Sequence[Sequence[int]],
+               size: tuple[int, int]) -> ndarray:
+    """Crop faces out of a greyscale image and resize them into a batch.
+
+    Args:
+        gray (ndarray): Greyscale image.
+        boxes (Sequence[Sequence[int]]): Boxes ([x, y, width, height]) of the
+            faces.
+        size (tuple[int, int]): Size (width, height) to which to resize each
+            face.
+
+    Returns:
+        ndarray: The faces, one per box, stacked along the first axis.
+    """
+    faces = []
+    for x, y, w, h in boxes:
+        face = gray[max(y, 0):y+h, max(x, 0):x+w]
+        if face.size == 0:
+            face = np.zeros(size[::-1], dtype=gray.dtype)
+        faces.append(cv2.resize(face, size))
+    return np.stack(faces)
+
+
+class ExpressionBackend:
+    """Expression inference backend base class."""
+
+    def detect_emotions(
+            self,
+            frame: ndarray,
+            face_rectangles: Optional[Sequence[Sequence[int]]] = None
+    ) -> FERList:
+        """Find faces in a frame and recognise their expressions.
+
+        Args:
+            frame (ndarray): BGR image in which to find faces.
+            face_rectangles (Optional[Sequence[Sequence[int]]], optional):
+                Boxes ([x, y, width, height]) of faces that are already known.
+                If given, face detection is skipped and only these faces are
+                classified. Defaults to None.
+
+        Returns:
+            FERList: List of boxes and emotions, one per face.
+        """
+        raise NotImplementedError
+
+    def warmup(self,
+               shape: tuple[int, ...] = (480, 640, 3),
+               iterations: int = 1) -> None:
+        """Run dummy inferences, so that the first real frames aren't slow.
+
+        Both face detection and emotion classification are exercised, on a
+        blank frame of the given shape.
+
+        Args:
+            shape (tuple[int, ...], optional): Shape of the frames that will be
+                passed to the backend. Defaults to (480, 640, 3).
+            iterations (int, optional): Number of times to run each.
+                Defaults to 1.
+        """
+        frame = np.zeros(shape, dtype=np.uint8)
+        height, width = shape[:2]
+        box = [width // 4, height // 4, width // 2, height // 2]
+        for _ in range(iterations):
+            self.detect_emotions(frame)
+            self.detect_emotions(frame, face_rectangles=[box])
+
+
+class FERBackend(ExpressionBackend):
+    """Backend using FER.
+
+    FER itself runs its emotion model once per face, so only its face
+    detector is used as is. Each face is then squared, given a margin and
+    cropped exactly as FER does, and FER's emotion model is run once per
+    frame on all of them.
+    """
+
+    # Margin FER adds around each face box before classifying it, and the
+    # border it pads the image with when the margin runs off the top or left.
+    offsets = (10, 10)
+    border = 40
+
+    def __init__(self, mtcnn: bool = False) -> None:
+        """Initialise the object.
+
+        FER (and hence TensorFlow) is only imported here so that other
+        backends don't pay for it.
+
+        Args:
+            mtcnn (bool, optional): Whether or not to use MTCNN for face
+                detection. Defaults to False.
+        """
+        from fer import FER
+        self._detector = FER(mtcnn=mtcnn, compile=True)
+        # FER keeps its model private (as of fer 21.0.4), so it is reused
+        # rather than loaded twice. Should a later release rename it, faces
+        # are classified one at a time by FER instead.
+        self._model = getattr(self._detector, "_FER__emotion_classifier", None)
+        if self._model is None:
+            logger.warning("FER's emotion model was not found; faces will "
+                           "be classified one at a time.")
+        else:
+            height, width = self._model.input_shape[1:3]
+            self.input_size = (width, height)
+
+    def detect_emotions(
+            self,
+            frame: ndarray,
+            face_rectangles: Optional[Sequence[Sequence[int]]] = None
+    ) -> FERList:
+        """Find faces in a frame and recognise their expressions."""
+        if self._model is None:
+            return self._detector.detect_emotions(
+                frame, face_rectangles=face_rectangles)
+        if face_rectangles is None:
+            face_rectangles = self._detector.find_faces(frame, bgr=True)
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        padded: Optional[ndarray] = None
+        boxes: list[list[int]] = []
+        faces: list[ndarray] = []
+        for box in face_rectangles:
+            x, y, w, h = (int(v) for v in self._detector.tosquare(box))
+            x_off, y_off = self.offsets
+            x1, x2, y1, y2 = x - x_off, x + w + x_off, y - y_off, y + h + y_off
+            image = gray
+            if y1 < 0 or x1 < 0:
+                if padded is None:
+                    padded = self._detector.pad(gray)
+                image = padded
+                x1, x2, y1, y2 = (v + self.border for v in (x1, x2, y1, y2))
+                x1, y1 = max(x1, 0), max(y1, 0)
+            face = image[y1:y2, x1:x2]
+            # FER skips faces that lie wholly outside the frame.
+            if face.size == 0:
+                continue
+            boxes.append([x, y, w, h])
+            faces.append(cv2.resize(face, self.input_size))
+        if not boxes:
+            return []
+
+        batch = np.stack(faces).astype(np.float32)[..., np.newaxis]
+        scores = self._model.predict((batch / 255.0 - 0.5) * 2.0)
+
+        results: FERList = []
+        for box, row in zip(boxes, scores):
+            emotions: Any = {label: round(float(score), 2)
+                             for label, score in zip(EMOTION_LABELS, row)}
+            results.append({'box': box, 'emotions': emotions})
+        return results
+
+
+class DNNBackend(ExpressionBackend):
+    """Backend using a Haar cascade and OpenCV's DNN module.
+
+    The model must take a batch of 64x64 greyscale faces in NCHW layout,
+    scaled to [-1, 1] (as FER does), and emit one probability per emotion in
+    the order given by EMOTION_LABELS. FER's own model can be exported with
+    tf2onnx using `--inputs-as-nchw`.
+    """
+
+    input_size = (64, 64)
+
+    def __init__(self, model_path: str) -> None:
+        """Initialise the object.
+
+        Args:
+            model_path (str): Path to the emotion model (ONNX or any other
+                format understood by `cv2.dnn.readNet`).
+        """
+        self._net = cv2.dnn.readNet(model_path)
+        self._cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect_emotions(
+            self,
+            frame: ndarray,
+            face_rectangles: Optional[Sequence[Sequence[int]]] = None
+    ) -> FERList:
+        """Find faces in a frame and recognise their expressions."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if face_rectangles is None:
+            face_rectangles = self._cascade.detectMultiScale(
+                gray, scaleFactor=1.1, minNeighbors=5, minSize=(50, 50))
+        boxes = [[int(v) for v in box] for box in face_rectangles]
+        if not boxes:
+            return []
+
+        faces = crop_faces(gray, boxes, self.input_size)
+        batch = faces.astype(np.float32)[:, np.newaxis]
+        self._net.setInput((batch / 255.0 - 0.5) * 2.0)
+        scores = self._net.forward().reshape(len(boxes), -1)
+
+        results: FERList = []
+        for box, row in zip(boxes, scores):
+            emotions: Any = dict(zip(EMOTION_LABELS, map(float, row)))
+            results.append({'box': box, 'emotions': emotions})
+        return results
+
+
+def make_backend(name: str,
+                 mtcnn: bool = False,
+                 model_path: str = "") -> ExpressionBackend:
+    """Construct an expression inference backend.
+
+    Args:
+        name (str): Name of the backend, either "fer" or "dnn".
+        mtcnn (bool, optional): Whether FER should use MTCNN for face
+            detection. Defaults to False.
+        model_path (str, optional): Path to the emotion model used by the DNN
+            backend. Defaults to "".
+
+    Raises:
+        ValueError: If the backend name is unknown or the DNN backend is
+            chosen without a model.
+
+    Returns:
+        ExpressionBackend: The backend.
+    """
+    name = name.strip().casefold()
+    if name == "fer":
+        return FERBackend(mtcnn=mtcnn)
+    elif name == "dnn":
+        if not model_path:
+            raise ValueError("The dnn backend requires a model_path.")
+        return DNNBackend(model_path)
+    raise ValueError(f'Unknown expression backend "{name}".')
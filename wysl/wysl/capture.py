@@ -0,0 +1,234 @@
+"""Video capture game component.
+
+Frames are pulled from the camera by `FrameCapture`, which reads in a
+background thread and only ever keeps the newest frame. This means expression
+detection always works on a fresh frame, rather than one that has been sitting
+in the driver's buffer while the previous frame was being processed.
+
+Besides cameras, video files and directories of images can be used as video
+sources (see `open_video_source`), so that the expression pipeline can be run
+on recorded sessions.
+"""
+
+import multiprocessing as mp
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import cv2
+from numpy import ndarray
+
+from .exceptions import CameraError
+from .types import VideoSource
+
+logger = mp.get_logger()
+
+IMAGE_SUFFIXES = ('.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+
+
+class ImageDirectoryCapture:
+    """Video source that reads the images in a directory, in name order."""
+
+    def __init__(self, path: str, fps: float = 30.0) -> None:
+        """Initialise the object.
+
+        Args:
+            path (str): Path to the directory.
+            fps (float, optional): Frame rate to report for the sequence.
+                Defaults to 30.0.
+        """
+        self._paths = sorted(p for p in Path(path).iterdir()
+                             if p.suffix.casefold() in IMAGE_SUFFIXES)
+        self._fps = fps
+        self._index = 0
+
+    def isOpened(self) -> bool:
+        """Whether there are any images to read."""
+        return len(self._paths) > 0
+
+    def read(self) -> tuple[bool, Any]:
+        """Read the next image.
+
+        Returns:
+            tuple[bool, Any]: Whether an image was read, and the image.
+        """
+        while self._index < len(self._paths):
+            frame = cv2.imread(str(self._paths[self._index]))
+            self._index += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def get(self, prop: int) -> float:
+        """Get a property of the sequence, as with cv2.VideoCapture."""
+        if prop == cv2.CAP_PROP_FPS:
+            return self._fps
+        elif prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self._paths)
+        return 0.0
+
+    def release(self) -> None:
+        """Release the source."""
+        self._paths = []
+
+
+def open_video_source(camera_index: int, source: str = "") -> VideoSource:
+    """Open a video source.
+
+    Args:
+        camera_index (int): Index of the camera to use, as understood by
+            opencv-python. Only used if source is empty.
+        source (str, optional): Path to a video file or a directory of
+            images. Defaults to "".
+
+    Returns:
+        VideoSource: The video source. Check `isOpened` before use.
+    """
+    if source:
+        if Path(source).is_dir():
+            return ImageDirectoryCapture(source)
+        return cv2.VideoCapture(source)
+    # DirectShow opens much faster than the default backend on Windows, but
+    # doesn't exist anywhere else.
+    api = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+    return cv2.VideoCapture(camera_index, api)
+
+
+class FrameCapture:
+    """Latest-frame capture stage.
+
+    Attributes:
+        captured (int): Number of frames read from the video feed.
+        consumed (int): Number of frames handed out by `read`.
+        dropped (int): Number of frames that were overwritten by a newer frame
+            before they could be consumed.
+        last_age (float): Age, in seconds, of the most recently consumed frame
+            at the time it was consumed.
+        max_age (float): Greatest age, in seconds, of any consumed frame.
+    """
+
+    def __init__(self,
+                 cap: VideoSource,
+                 timeout: float = 1.0,
+                 fps: float = 0.0) -> None:
+        """Initialise the object.
+
+        Args:
+            cap (VideoSource): The (opened) video feed from which to draw
+                frames.
+            timeout (float, optional): How long to wait for a new frame before
+                giving up. Defaults to 1.0.
+            fps (float, optional): Rate at which to read frames. This should
+                be given for recorded sources, which could otherwise be read
+                far faster than real time. Set to 0 to read as fast as the
+                source allows. Defaults to 0.0.
+        """
+        self._cap = cap
+        self._timeout = timeout
+        self._period = 1 / fps if fps > 0 else 0.0
+        self._cond = threading.Condition()
+        self._frame: Optional[ndarray] = None
+        self._timestamp = 0.0
+        self._fresh = False
+        self._failed = False
+        self._running = False
+        self._active = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name="CaptureThread",
+                                        daemon=True)
+        self._total_age = 0.0
+        self.captured = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.last_age = 0.0
+        self.max_age = 0.0
+
+    @property
+    def mean_age(self) -> float:
+        """Mean age, in seconds, of consumed frames at consumption."""
+        return self._total_age / self.consumed if self.consumed else 0.0
+
+    def start(self) -> None:
+        """Start capturing frames in the background."""
+        self._running = True
+        self._active.set()
+        self._thread.start()
+
+    def pause(self) -> None:
+        """Stop reading frames until resumed, leaving the source open."""
+        self._active.clear()
+
+    def resume(self) -> None:
+        """Resume reading frames after a pause."""
+        with self._cond:
+            self._fresh = False
+        self._active.set()
+
+    def stop(self) -> None:
+        """Stop capturing frames and wait for the capture thread to finish."""
+        self._running = False
+        self._active.set()
+        if self._thread.is_alive():
+            self._thread.join(self._timeout)
+
+    def read(self) -> tuple[ndarray, float]:
+        """Get the newest frame that has not yet been consumed.
+
+        Blocks until a frame newer than the last one returned is available.
+
+        Raises:
+            CameraError: If the video feed failed or no frame arrived within
+                the timeout.
+
+        Returns:
+            tuple[ndarray, float]: The frame, and the time (as returned by
+                `time.monotonic`) at which it was captured.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._fresh or self._failed,
+                                self._timeout)
+            if not self._fresh:
+                raise CameraError("Failed to read from camera.")
+            self._fresh = False
+            frame, timestamp = self._frame, self._timestamp
+        age = time.monotonic() - timestamp
+        self.consumed += 1
+        self.last_age = age
+        self.max_age = max(self.max_age, age)
+        self._total_age += age
+        return frame, timestamp
+
+    def stats(self) -> str:
+        """Summarise the capture counters as a human-readable string."""
+        return (f'captured={self.captured} consumed={self.consumed} '
+                f'dropped={self.dropped} '
+                f'age(last/mean/max)={self.last_age*1000:.1f}/'
+                f'{self.mean_age*1000:.1f}/{self.max_age*1000:.1f}ms')
+
+    def _run(self) -> None:
+        """Capture thread body."""
+        next_read = time.monotonic()
+        while self._running:
+            if not self._active.is_set():
+                self._active.wait()
+                next_read = time.monotonic()
+                continue
+            if self._period:
+                time.sleep(max(next_read - time.monotonic(), 0))
+                next_read += self._period
+            stat, frame = self._cap.read()
+            timestamp = time.monotonic()
+            with self._cond:
+                if not stat:
+                    self._failed = True
+                    self._cond.notify_all()
+                    break
+                if self._fresh:
+                    self.dropped += 1
+                self._frame = frame
+                self._timestamp = timestamp
+                self._fresh = True
+                self.captured += 1
+                self._cond.notify_all()
@@ -0,0 +1,338 @@
+"""Shared memory transport from the detection processes.
+
+Sending results over a pipe pickles and copies them, which is fine for the
+occasional event but not for streaming a full set of features (scores, face
+boxes, volumes, etc) for every frame or audio chunk. A `RingChannel` instead
+holds a ring of fixed-size NumPy records in shared memory. The detection
+process writes one record per frame or chunk with a `ChannelWriter`, and the
+main process reads them through a `ChannelConnection`, which looks like the
+`Connection` it would otherwise use, so the main loop can wait on and
+receive from either in the same way.
+
+The worker's ordinary pipe is still used for control messages (READY,
+errors, statistics, etc) and doubles as the doorbell: when a record is
+written and the reader isn't already due to wake up, the writer sends
+`CommandEnum.DOORBELL` down the pipe. The reader clears the doorbell flag
+when it receives one, so there is at most one doorbell in flight however
+many records are written.
+
+The header holds the number of records written and read (each only ever
+advanced by one side), the doorbell flag, and the number of records dropped
+because the ring was full. Only records carrying features alone are
+dropped: if the ring is full when an event is to be emitted, the event is
+sent down the pipe instead (without its features), and the reader hands it
+over after the older records still in the ring.
+"""
+
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Mapping, Optional
+
+import numpy as np
+from numpy import ndarray
+
+from .backends import EMOTION_LABELS
+from .enums import CommandEnum, EventEnum
+from .types import TimedEvent
+
+logger = mp.get_logger()
+
+# Header fields.
+WRITTEN, READ, DOORBELL, DROPPED = range(4)
+HEADER_FIELDS = 4
+RECORDS_OFFSET = HEADER_FIELDS * 8
+
+# Events are stored by their index in this list.
+EVENTS = list(EventEnum)
+
+# Fields common to all records. "emit" is whether the worker's emission
+# policy passed the event on; records that weren't emitted only carry
+# features.
+BASE_FIELDS = [("emit", "u1"), ("event", "u1"), ("timestamp", "f8")]
+
+EXPRESSION_RECORD = np.dtype(BASE_FIELDS + [
+    ("faces", "u2"),
+    ("box", "i4", 4),
+    ("emotions", "f4", len(EMOTION_LABELS)),
+])
+
+LAUGHTER_RECORD = np.dtype(BASE_FIELDS + [
+    ("volume", "f4"),
+    ("threshhold", "f4"),
+    ("rhythm", "f4"),
+])
+
+
+def _views(buf: memoryview,
+           dtype: np.dtype,
+           capacity: int) -> tuple[ndarray, ndarray]:
+    """Map the header and records arrays onto a shared memory buffer."""
+    header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+    records = np.ndarray((capacity,), dtype=dtype, buffer=buf,
+                         offset=RECORDS_OFFSET)
+    return header, records
+
+
+class RingChannel:
+    """Ring of records in shared memory, owned by the main process."""
+
+    def __init__(self, dtype: np.dtype, capacity: int = 256) -> None:
+        """Initialise the object, creating the shared memory.
+
+        Args:
+            dtype (np.dtype): Structured type of the records, which must
+                include the fields in BASE_FIELDS.
+            capacity (int, optional): Number of records the ring can hold.
+                Defaults to 256.
+        """
+        self.dtype = dtype
+        self.capacity = capacity
+        self._shm = SharedMemory(
+            create=True, size=RECORDS_OFFSET + dtype.itemsize * capacity)
+        self._header, self._records = _views(self._shm.buf, dtype, capacity)
+        self._header[:] = 0
+
+    def writer(self, pipe: Connection) -> "ChannelWriter":
+        """Get a writer for the worker, which rings the doorbell on pipe."""
+        return ChannelWriter(self._shm.name, self.dtype, self.capacity, pipe)
+
+    def connection(self, pipe: Connection) -> "ChannelConnection":
+        """Get the reading end, combined with our end of the worker's pipe."""
+        return ChannelConnection(self._header, self._records, pipe)
+
+    @property
+    def dropped(self) -> int:
+        """Number of records dropped because the ring was full."""
+        return int(self._header[DROPPED])
+
+    def close(self) -> None:
+        """Release the shared memory."""
+        del self._header, self._records
+        self._shm.close()
+        self._shm.unlink()
+
+
+def format_features(features: Mapping[str, ndarray]) -> str:
+    """Tabulate the latest record received from several channels for display.
+
+    Args:
+        features (Mapping[str, ndarray]): Records keyed by pipe name.
+
+    Returns:
+        str: The table.
+    """
+    base = dict(BASE_FIELDS)
+    lines = []
+    for name, record in features.items():
+        lines.append(f'{name} (latest features):')
+        for field in record.dtype.names:
+            if field in base:
+                continue
+            value = record[field]
+            if field == "emotions":
+                text = " ".join(f'{label}={score:.2f}'
+                                for label, score in zip(EMOTION_LABELS, value))
+            elif np.ndim(value):
+                text = " ".join(str(item) for item in value)
+            else:
+                text = f'{float(value):g}'
+            lines.append(f'  {field:<16}{text}')
+    return "\n".join(lines)
+
+
+class ChannelWriter:
+    """Writing end of a RingChannel, for use in the worker process."""
+
+    def __init__(self,
+                 name: str,
+                 dtype: np.dtype,
+                 capacity: int,
+                 pipe: Connection) -> None:
+        """Initialise the object.
+
+        The shared memory is only attached to on the first send, so that
+        creating a writer to hand to a worker doesn't map it in the parent.
+
+        Args:
+            name (str): Name of the shared memory block.
+            dtype (np.dtype): Structured type of the records.
+            capacity (int): Number of records in the ring.
+            pipe (Connection): The worker's end of its pipe, on which to ring
+                the doorbell.
+        """
+        self._args = (name, dtype, capacity, pipe)
+        self._shm: Optional[SharedMemory] = None
+        self._blank = np.zeros((), dtype=dtype)
+        self._capacity = capacity
+        self._pipe = pipe
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        """Reattach to the shared memory when sent to another process."""
+        return (self.__class__, self._args)
+
+    def send(self,
+             event: EventEnum,
+             timestamp: float,
+             emit: bool = True,
+             **features: Any) -> bool:
+        """Write a record.
+
+        Args:
+            event (EventEnum): The classification.
+            timestamp (float): Time (as returned by `time.monotonic`) at which
+                the frame or chunk was captured.
+            emit (bool, optional): Whether the event should be acted on, as
+                opposed to only being a carrier for the features.
+                Defaults to True.
+            **features (Any): Values for the other fields of the record.
+                Fields not given are zeroed.
+
+        Returns:
+            bool: False if the ring was full, in which case the event was
+                sent down the pipe if it was to be emitted, and the record
+                was dropped otherwise.
+        """
+        if self._shm is None:
+            name, dtype, capacity, _ = self._args
+            self._shm = SharedMemory(name=name)
+            self._header, self._records = _views(self._shm.buf, dtype,
+                                                 capacity)
+        written = int(self._header[WRITTEN])
+        if written - int(self._header[READ]) >= self._capacity:
+            if emit:
+                self._pipe.send(TimedEvent(event, timestamp))
+            else:
+                self._header[DROPPED] += 1
+            return False
+        index = written % self._capacity
+        records = self._records
+        records[index] = self._blank
+        records["emit"][index] = emit
+        records["event"][index] = EVENTS.index(event)
+        records["timestamp"][index] = timestamp
+        for name, value in features.items():
+            records[name][index] = value
+        # Only publish the record once it's complete.
+        self._header[WRITTEN] = written + 1
+        if not self._header[DOORBELL]:
+            self._header[DOORBELL] = 1
+            self._pipe.send(CommandEnum.DOORBELL)
+        return True
+
+    def close(self) -> None:
+        """Detach from the shared memory."""
+        if self._shm is not None:
+            del self._header, self._records
+            self._shm.close()
+            self._shm = None
+
+
+class ChannelConnection:
+    """Reading end of a RingChannel, combined with the worker's pipe.
+
+    This supports the subset of the `Connection` interface used by the main
+    loop, and can be passed to `multiprocessing.connection.wait`. Records are
+    received as `TimedEvent`s, with the record itself as the features, and
+    an event of None if the worker's emission policy held it back.
+    """
+
+    def __init__(self,
+                 header: ndarray,
+                 records: ndarray,
+                 pipe: Connection) -> None:
+        """Initialise the object.
+
+        Args:
+            header (ndarray): The channel's header.
+            records (ndarray): The channel's records.
+            pipe (Connection): Our end of the worker's pipe.
+        """
+        self._header = header
+        self._records = records
+        self._pipe = pipe
+        self._pending: deque[Any] = deque()
+
+    def fileno(self) -> int:
+        """Get the file descriptor (or handle) on which to wait."""
+        return self._pipe.fileno()
+
+    def send(self, obj: Any) -> None:
+        """Send an object to the worker over its pipe."""
+        self._pipe.send(obj)
+
+    def poll(self, timeout: Optional[float] = 0.0) -> bool:
+        """Whether there is anything to receive.
+
+        Args:
+            timeout (Optional[float], optional): How long to wait for
+                something, in seconds. If None, wait indefinitely.
+                Defaults to 0.0.
+        """
+        if self._pending or self._available():
+            return True
+        while self._pipe.poll(timeout):
+            message = self._pipe.recv()
+            if message is not CommandEnum.DOORBELL:
+                self._pending.append(message)
+                return True
+            self._header[DOORBELL] = 0
+            if self._available():
+                return True
+            timeout = 0.0
+        return False
+
+    def recv(self) -> Any:
+        """Receive the next message or record, blocking until there is one."""
+        while not self.poll(None):
+            pass
+        if self._pending and not self._behind(self._pending[0]):
+            return self._pending.popleft()
+        read = int(self._header[READ])
+        record = self._records[read % len(self._records)].copy()
+        self._header[READ] = read + 1
+        event = EVENTS[record["event"]] if record["emit"] else None
+        return TimedEvent(event, float(record["timestamp"]), record)
+
+    def clear(self) -> int:
+        """Discard all messages and records waiting to be received.
+
+        This must only be done while the worker is paused, so that it isn't
+        writing at the same time.
+
+        Returns:
+            int: The number of messages and records discarded, not counting
+                doorbells.
+        """
+        count = len(self._pending)
+        self._pending.clear()
+        while self._pipe.poll(0):
+            if self._pipe.recv() is not CommandEnum.DOORBELL:
+                count += 1
+        written = int(self._header[WRITTEN])
+        count += written - int(self._header[READ])
+        self._header[READ] = written
+        self._header[DOORBELL] = 0
+        return count
+
+    def close(self) -> None:
+        """Close our end of the pipe, and let go of the shared memory."""
+        self._pipe.close()
+        self._header = self._records = np.zeros(0)
+
+    def _available(self) -> bool:
+        """Whether there are records waiting to be read."""
+        return int(self._header[WRITTEN]) > int(self._header[READ])
+
+    def _behind(self, message: Any) -> bool:
+        """Whether a message should wait for the next record in the ring.
+
+        An event that overflowed the ring is newer than the records that
+        filled it, so it must not overtake them.
+        """
+        if not isinstance(message, TimedEvent) or not self._available():
+            return False
+        read = int(self._header[READ])
+        record = self._records[read % len(self._records)]
+        return float(record["timestamp"]) <= message.timestamp
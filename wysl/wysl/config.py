@@ -25,15 +25,50 @@ DEFAULT_CONFIG: dict[str, dict[str, str]] = {
         "low_threshhold": "0.2",
         "medium_threshhold": "0.3",
         "high_threshhold": "0.4",
+        "tracking": "False",
+        "redetect_interval": "10",
+        "tracking_confidence": "0.6",
+        "backend": "fer",
+        "model_path": "",
+        "heartbeat": "1.0",
+        "smoothing": "none",
+        "smoothing_window": "5",
+        "smoothing_alpha": "0.3",
+        "hysteresis": "0.0",
+        "headless": "False",
+        "viewer": "False",
+        "viewer_fps": "10.0",
+        "source": "",
+        "inference_width": "0",
+        "target_fps": "0",
+        "warmup": "1",
+        "player_policy": "first",
     },
     "laughter": {
         "microphone_index": "0",
         "chunk_duration": "0.05",
         "records": "10",
         "hits": "5",
+        "heartbeat": "1.0",
+        "buffer_duration": "2.0",
+        "duty_cycle": "0",
+        "detector": "rms",
+        "rhythm_threshhold": "0.4",
+        "source": "",
+        "headless": "False",
+        "plot_fps": "15.0",
+        "passthrough": "True",
+        "sample_rate": "16000",
+        "hop_duration": "0",
+        "profile": "standard",
+        "adaptive_threshhold": "False",
+        "noise_k": "3.0",
+        "noise_halflife": "30.0",
+        "noise_hit_weight": "0.0",
     },
     "arduino": {
         "baudrate": "9600",
+        "verify_interval": "5.0",
     },
     "network": {
         "remote_port": "5005",
@@ -47,6 +82,9 @@ DEFAULT_CONFIG: dict[str, dict[str, str]] = {
         "feather_channel": "1",
         "balloon_channel": "2",
         "squeeze_duration": "5.0",
+        "stats_interval": "10.0",
+        "keep_warm": "False",
+        "transport": "pipe",
     }
 }
 
@@ -65,13 +103,48 @@ CONFIG_TYPES: tuple[tuple[str, str, str], ...] = (
     ("expression", "low_threshhold", "float"),
     ("expression", "medium_threshhold", "float"),
     ("expression", "high_threshhold", "float"),
+    ("expression", "tracking", "bool"),
+    ("expression", "redetect_interval", "int"),
+    ("expression", "tracking_confidence", "float"),
+    ("expression", "backend", "str"),
+    ("expression", "model_path", "str"),
+    ("expression", "heartbeat", "float"),
+    ("expression", "smoothing", "str"),
+    ("expression", "smoothing_window", "int"),
+    ("expression", "smoothing_alpha", "float"),
+    ("expression", "hysteresis", "float"),
+    ("expression", "headless", "bool"),
+    ("expression", "viewer", "bool"),
+    ("expression", "viewer_fps", "float"),
+    ("expression", "source", "str"),
+    ("expression", "inference_width", "int"),
+    ("expression", "target_fps", "float"),
+    ("expression", "warmup", "int"),
+    ("expression", "player_policy", "str"),
     ("laughter", "microphone_index", "int"),
     ("laughter", "chunk_duration", "float"),
     ("laughter", "threshhold", "float"),
     ("laughter", "records", "int"),
     ("laughter", "hits", "int"),
+    ("laughter", "heartbeat", "float"),
+    ("laughter", "buffer_duration", "float"),
+    ("laughter", "duty_cycle", "float"),
+    ("laughter", "detector", "str"),
+    ("laughter", "rhythm_threshhold", "float"),
+    ("laughter", "source", "str"),
+    ("laughter", "headless", "bool"),
+    ("laughter", "plot_fps", "float"),
+    ("laughter", "passthrough", "bool"),
+    ("laughter", "sample_rate", "int"),
+    ("laughter", "hop_duration", "float"),
+    ("laughter", "profile", "str"),
+    ("laughter", "adaptive_threshhold", "bool"),
+    ("laughter", "noise_k", "float"),
+    ("laughter", "noise_halflife", "float"),
+    ("laughter", "noise_hit_weight", "float"),
     ("arduino", "port", "str"),
     ("arduino", "baudrate", "int"),
+    ("arduino", "verify_interval", "float"),
     ("network", "remote_ip", "str"),
     ("network", "remote_port", "int"),
     ("network", "local_ip", "str"),
@@ -83,6 +156,9 @@ CONFIG_TYPES: tuple[tuple[str, str, str], ...] = (
     ("game", "feather_channel", "int"),
     ("game", "balloon_channel", "int"),
     ("game", "squeeze_duration", "float"),
+    ("game", "stats_interval", "float"),
+    ("game", "keep_warm", "bool"),
+    ("game", "transport", "str"),
 )
 
 
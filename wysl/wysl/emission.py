@@ -0,0 +1,61 @@
+"""Event emission policy shared by the detection processes.
+
+The detection loops classify every frame or audio chunk, but in steady state
+the classification hardly ever changes. Sending every classification to the
+parent process means that every one of them gets forwarded over the network
+and turned into a relay command, so workers instead ask an `EmissionPolicy`
+whether a classification is worth sending.
+"""
+
+import time
+from typing import Any, Optional
+
+
+class EmissionPolicy:
+    """Send on state transitions, plus an optional periodic heartbeat.
+
+    Attributes:
+        sent (int): Number of values the policy allowed to be sent.
+        suppressed (int): Number of values the policy suppressed.
+    """
+
+    _unset = object()
+
+    def __init__(self, heartbeat: float = 1.0) -> None:
+        """Initialise the object.
+
+        Args:
+            heartbeat (float, optional): Interval, in seconds, at which to
+                re-send an unchanged value, so that the state is eventually
+                restored if a message is lost. Set to 0 to only ever send on
+                changes. Defaults to 1.0.
+        """
+        self._heartbeat = heartbeat
+        self._last: Any = self._unset
+        self._last_sent = 0.0
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_send(self, value: Any, now: Optional[float] = None) -> bool:
+        """Decide whether a value should be sent, and record it if so.
+
+        Args:
+            value (Any): The latest classification.
+            now (Optional[float], optional): The current time, as returned by
+                `time.monotonic`. If None, it is looked up. Defaults to None.
+
+        Returns:
+            bool: True if the value has changed since the last one sent, or if
+                the heartbeat interval has elapsed; False otherwise.
+        """
+        if now is None:
+            now = time.monotonic()
+        if (value != self._last
+                or (self._heartbeat > 0
+                    and now - self._last_sent >= self._heartbeat)):
+            self._last = value
+            self._last_sent = now
+            self.sent += 1
+            return True
+        self.suppressed += 1
+        return False
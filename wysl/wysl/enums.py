@@ -14,6 +14,8 @@ class ErrorEnum(Enum):
     MICROPHONE_ERROR = auto()
     SERIAL_ERROR = auto()
     NETWORK_ERROR = auto()
+    MODEL_ERROR = auto()
+    CONFIG_ERROR = auto()
 
 
 class EventEnum(Enum):
@@ -46,6 +48,10 @@ class CommandEnum(Enum):
 
     TERMINATE = auto()
     START = auto()
+    SHOW_STATS = auto()
+    READY = auto()
+    PAUSE = auto()
+    DOORBELL = auto()
     CHANNEL_ON = '+'
     CHANNEL_OFF = '-'
     PULSE_CHANNEL = '!'
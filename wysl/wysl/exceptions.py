@@ -23,3 +23,11 @@ class SerialError(Exception):
 
 class NetworkError(Exception):
     """Exception to be raised when there is a problem with the network."""
+
+
+class ModelError(Exception):
+    """Exception to be raised when the expression model cannot be loaded."""
+
+
+class ConfigError(Exception):
+    """Exception to be raised when a setting has an invalid value."""
@@ -1,16 +1,28 @@
 """Expression detection game component."""
 
 import multiprocessing as mp
-from functools import partial
+import time
 from multiprocessing.connection import Connection
+from typing import Any, Optional
 
 import cv2
-from fer import FER
+import numpy as np
 from numpy import ndarray
 
+from .backends import EMOTION_LABELS, ExpressionBackend, make_backend
+from .capture import FrameCapture, open_video_source
+from .channel import ChannelWriter
+from .emission import EmissionPolicy
 from .enums import CommandEnum, ErrorEnum, EventEnum
 from .exceptions import CameraError
-from .types import ExpressionClassifier, FEREmotions, FERList
+from .instrumentation import (NO_INSTRUMENTATION, Instrumentation,
+                              format_summary)
+from .players import PlayerSelector
+from .pool import wait_for_resume
+from .tracking import FaceTracker
+from .types import (ExpressionClassifier, FEREmotions, FERList, FrameDisplay,
+                    StatsReport, TimedEvent)
+from .viewer import FramePublisher
 
 logger = mp.get_logger()
 
@@ -22,9 +34,34 @@ def expression_loop(pipe: Connection,
                     surprise_weight: float,
                     low_threshhold: float,
                     medium_threshhold: float,
-                    high_threshhold: float) -> None:
+                    high_threshhold: float,
+                    tracking: bool = False,
+                    redetect_interval: int = 10,
+                    tracking_confidence: float = 0.6,
+                    backend: str = "fer",
+                    model_path: str = "",
+                    heartbeat: float = 1.0,
+                    smoothing: str = "none",
+                    smoothing_window: int = 5,
+                    smoothing_alpha: float = 0.3,
+                    hysteresis: float = 0.0,
+                    headless: bool = False,
+                    viewer: bool = False,
+                    viewer_fps: float = 10.0,
+                    source: str = "",
+                    inference_width: int = 0,
+                    target_fps: float = 0.0,
+                    stats_interval: float = 10.0,
+                    warmup: int = 1,
+                    player_policy: str = "first",
+                    channel: Optional[ChannelWriter] = None) -> None:
     """Expression detection loop.
 
+    Once the camera is open and the model has been warmed up, CommandEnum.READY
+    is sent to the parent process. The loop can be paused with
+    CommandEnum.PAUSE, after which it sends nothing until it is resumed with
+    CommandEnum.START (at which point it is READY again).
+
     Args:
         pipe (Connection): IPC pipe for communicating with our parent process.
         camera_index (int): Index of the camera to use, as understood by
@@ -42,127 +79,452 @@ def expression_loop(pipe: Connection,
             smile.
         high_threshhold (float): Threshold that must be met or exceeded in
             order for an expression to be classified as a high intensity smile.
+        tracking (bool, optional): Whether to track the face between full
+            detections rather than detecting it in every frame.
+            Defaults to False.
+        redetect_interval (int, optional): Maximum number of frames to track
+            the face before running a full detection again. Defaults to 10.
+        tracking_confidence (float, optional): Minimum template match score
+            for the tracked face to be trusted. Defaults to 0.6.
+        backend (str, optional): Name of the expression inference backend to
+            use ("fer" or "dnn"). Defaults to "fer".
+        model_path (str, optional): Path to the emotion model used by the dnn
+            backend. Defaults to "".
+        heartbeat (float, optional): Interval, in seconds, at which to re-send
+            an unchanged classification. Set to 0 to only send changes.
+            Defaults to 1.0.
+        smoothing (str, optional): How to smooth the weighted average over
+            time: "none", "mean", "median" or "ema". Defaults to "none".
+        smoothing_window (int, optional): Number of recent frames over which
+            to take the mean or median. Defaults to 5.
+        smoothing_alpha (float, optional): Smoothing factor of the exponential
+            moving average. Defaults to 0.3.
+        hysteresis (float, optional): Margin by which the smoothed average must
+            cross a threshold before the intensity level changes.
+            Defaults to 0.0.
+        headless (bool, optional): Whether to skip displaying the camera feed
+            entirely. Defaults to False.
+        viewer (bool, optional): Whether to display the camera feed from a
+            separate viewer process rather than the detection loop. Ignored
+            if headless. Defaults to False.
+        viewer_fps (float, optional): Rate at which the viewer process renders
+            the camera feed. Defaults to 10.0.
+        source (str, optional): Path to a video file or directory of images
+            to use instead of the camera. Recorded sources are played back in
+            real time. Defaults to "".
+        inference_width (int, optional): Width to which frames are downscaled
+            before faces are detected. Set to 0 to use the full resolution.
+            Defaults to 0.
+        target_fps (float, optional): Maximum rate at which to process frames.
+            Set to 0 to process frames as fast as possible. Defaults to 0.0.
+        stats_interval (float, optional): Interval, in seconds, at which to log
+            timing statistics and report them to the parent process. Set to 0
+            to disable instrumentation. Defaults to 10.0.
+        warmup (int, optional): Number of dummy inferences to run before
+            reporting ready. Defaults to 1.
+        player_policy (str, optional): How to pick out the player's face when
+            there are several: "first", "largest", "centre" or "sticky".
+            Defaults to "first".
+        channel (Optional[ChannelWriter], optional): Shared memory channel
+            on which to send the classification and features of every frame.
+            If None, only events are sent, over the pipe. Defaults to None.
     """
     logger.info("Starting: %s", locals())
 
-    # For later convenience.
-    classifier = partial(classify_expression,
-                         happy_weight=happy_weight,
-                         surprise_weight=surprise_weight,
-                         low_threshhold=low_threshhold,
-                         medium_threshhold=medium_threshhold,
-                         high_threshhold=high_threshhold)
-
     # Setup the camera feed and expression detector.
-    detector = FER(mtcnn=mtcnn, compile=True)
-    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+    try:
+        classifier = SmoothedClassifier(happy_weight=happy_weight,
+                                        surprise_weight=surprise_weight,
+                                        low_threshhold=low_threshhold,
+                                        medium_threshhold=medium_threshhold,
+                                        high_threshhold=high_threshhold,
+                                        smoothing=smoothing,
+                                        window=smoothing_window,
+                                        alpha=smoothing_alpha,
+                                        hysteresis=hysteresis)
+        selector = PlayerSelector(player_policy)
+    except ValueError as e:
+        logger.error(e)
+        pipe.send(ErrorEnum.CONFIG_ERROR)
+        exit()
+    try:
+        detector = make_backend(backend, mtcnn=mtcnn, model_path=model_path)
+    except (ValueError, cv2.error) as e:
+        logger.error(e)
+        pipe.send(ErrorEnum.MODEL_ERROR)
+        exit()
+    tracker = (FaceTracker(redetect_interval, tracking_confidence)
+               if tracking else None)
+    cap = open_video_source(camera_index, source)
 
     if not cap.isOpened():
-        logger.error(f'Failed to open stream {camera_index}')
+        logger.error(f'Failed to open stream {source or camera_index}')
         pipe.send(ErrorEnum.CAMERA_ERROR)
         exit()
 
+    # Warm the model up on frames of the size it will actually be given.
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
+    if 0 < inference_width < width:
+        height = round(height * inference_width / width)
+        width = inference_width
+    detector.warmup((height, width, 3), warmup)
+
+    display: Optional[FrameDisplay] = None
+    publisher: Optional[FramePublisher] = None
+    if viewer and not headless:
+        display = publisher = FramePublisher(viewer_fps)
+    elif not headless:
+        display = do_show
+
+    capture = FrameCapture(cap,
+                           fps=cap.get(cv2.CAP_PROP_FPS) if source else 0.0)
+    capture.start()
+    policy = EmissionPolicy(heartbeat)
+    timer = Instrumentation(enabled=stats_interval > 0)
+    period = 1 / target_fps if target_fps > 0 else 0.0
+    next_frame = time.monotonic()
+    next_report = next_frame + stats_interval
+    pipe.send(CommandEnum.READY)
+
     while True:
         if pipe.poll(0):
             payload = pipe.recv()
             if payload == CommandEnum.TERMINATE:
                 break
+            elif payload == CommandEnum.PAUSE:
+                capture.pause()
+                if not wait_for_resume(pipe, idle=(
+                        (lambda: cv2.waitKey(1)) if display is do_show
+                        else None)):
+                    break
+                capture.resume()
+                # Start the new game without anything from the last one.
+                policy = EmissionPolicy(heartbeat)
+                classifier.reset()
+                selector.clear()
+                if tracker is not None:
+                    tracker = FaceTracker(redetect_interval,
+                                          tracking_confidence)
+                pipe.send(CommandEnum.READY)
 
         try:
-            emotions = get_emotions(cap, detector, classifier)
+            emotions = get_emotions(capture, detector, classifier, tracker,
+                                    display, inference_width, timer,
+                                    selector)
         except CameraError as e:
             logger.error(e.args)
             pipe.send(ErrorEnum.CAMERA_ERROR)
+            break
 
         try:
-            pipe.send(emotions)
+            emit = policy.should_send(emotions.event)
+            if channel is not None:
+                channel.send(emotions.event, emotions.timestamp, emit,
+                             **emotions.features)
+            elif emit:
+                pipe.send(emotions._replace(features=None))
+            timer.mark("send")
         except BrokenPipeError as e:
             logger.error(e.args)
             break
 
-        if cv2.waitKey(1) == ord('q'):
+        if ((publisher is not None and publisher.quit_requested)
+                or (display is do_show and cv2.waitKey(1) == ord('q'))):
             logger.info("Camera stream terminated by user.")
             pipe.send(CommandEnum.TERMINATE)
             break
 
+        now = time.monotonic()
+        if timer.enabled and now >= next_report:
+            timer.gauge("dropped_frames", capture.dropped)
+            timer.gauge("events_sent", policy.sent)
+            timer.gauge("events_suppressed", policy.suppressed)
+            summary = timer.summary()
+            logger.info("Timings: %s", format_summary(summary))
+            pipe.send(StatsReport(mp.current_process().name, summary))
+            next_report = now + stats_interval
+
+        # Hold the frame rate down to the target, without trying to catch up
+        # if we've fallen behind.
+        if period:
+            next_frame = max(next_frame + period, now)
+            time.sleep(next_frame - now)
+
     # Clean up after ourselves.
+    logger.info("Capture: %s", capture.stats())
+    capture.stop()
     cap.release()
+    if publisher is not None:
+        publisher.close()
     cv2.destroyAllWindows()
+    if channel is not None:
+        channel.close()
     pipe.close()
 
 
 def get_emotions(
-        cap: cv2.VideoCapture,
-        detector: FER,
-        classifier: ExpressionClassifier) -> EventEnum:
+        capture: FrameCapture,
+        detector: ExpressionBackend,
+        classifier: ExpressionClassifier,
+        tracker: Optional[FaceTracker] = None,
+        display: Optional[FrameDisplay] = None,
+        inference_width: int = 0,
+        timer: Instrumentation = NO_INSTRUMENTATION,
+        selector: Optional[PlayerSelector] = None) -> TimedEvent:
     """Capture a frame of video and extract emotions.
 
     Args:
-        cap (cv2.VideoCapture): The video feed from which to draw frames.
-        detector (FER): The FER instance to use to recognise expressions.
+        capture (FrameCapture): The capture stage from which to draw frames.
+        detector (ExpressionBackend): The backend to use to recognise
+            expressions.
         classifier (ExpressionClassifier): Function to use to classify the
             expressions detected.
+        tracker (Optional[FaceTracker], optional): Tracker to use to follow the
+            face between full detections. If None, faces are detected in every
+            frame. Defaults to None.
+        display (Optional[FrameDisplay], optional): Function to use to display
+            the frame and detected faces. If None, nothing is displayed.
+            Defaults to None.
+        inference_width (int, optional): Width to which the frame is
+            downscaled before faces are detected. Set to 0 to use the full
+            resolution. Defaults to 0.
+        timer (Instrumentation, optional): Instrumentation with which to time
+            each stage. Defaults to NO_INSTRUMENTATION.
+        selector (Optional[PlayerSelector], optional): Selector with which to
+            pick out the player's face. If None, the first face found is
+            taken. Defaults to None.
 
     Raises:
         CameraError: If there is an issue getting a frame from the video feed.
 
     Returns:
-        EventEnum: EventEnum corresponding to the expression detected.
+        TimedEvent: EventEnum corresponding to the expression detected, the
+            time at which the frame was captured, and the features of the
+            frame (number of faces, and box and scores of the first).
     """
-    # Pull a frame of video.
-    stat, frame = cap.read()
-    if not stat:
-        raise CameraError("Failed to read from camera.")
+    # Pull the newest frame of video.
+    timer.start()
+    frame, captured_at = capture.read()
+    timer.mark("wait")
+    timer.record("frame_age", time.monotonic() - captured_at)
 
     ret = EventEnum.NO_SMILE_DETECTED  # Default state
     # Horizontal flip to make the displayed feed "mirror-like".
     frame = cv2.flip(frame, 1)
-    emotions = detector.detect_emotions(frame)
-    # If any faces were detected, classify the expression of the first one.
+    emotions = detect_emotions(frame, detector, tracker, inference_width,
+                               selector)
+    timer.mark("inference")
+    # If any faces were detected, classify the expression of the player's,
+    # which comes first.
+    features: dict[str, Any] = {"faces": len(emotions)}
     if len(emotions) > 0:
         ret = classifier(emotions[0]['emotions'])
+        features["box"] = emotions[0]['box']
+        features["emotions"] = [emotions[0]['emotions'][label]
+                                for label in EMOTION_LABELS]
+    timer.mark("classification")
 
     # Display the frame and return the emotion detected.
-    do_show(frame, emotions)
-    return ret
+    if display is not None:
+        display(frame, emotions)
+        timer.mark("display")
+    return TimedEvent(ret, captured_at, features)
+
+
+def detect_emotions(frame: ndarray,
+                    detector: ExpressionBackend,
+                    tracker: Optional[FaceTracker] = None,
+                    inference_width: int = 0,
+                    selector: Optional[PlayerSelector] = None) -> FERList:
+    """Find faces in a frame and recognise their expressions.
 
+    The expressions of all of the faces found are recognised at once. If a
+    selector is given, the player's face is moved to the front of the list.
 
-def classify_expression(emotions: FEREmotions,
-                        happy_weight: float,
-                        surprise_weight: float,
-                        low_threshhold: float,
-                        medium_threshhold: float,
-                        high_threshhold: float) -> EventEnum:
-    """Classify emotions into no, low, medium, or high intensity smiles.
+    When a tracker is given, full face detection is only run when the tracker
+    asks for it; otherwise the tracked (player's) face box is passed to the
+    detector so that only the emotion classifier is run.
+
+    If the frame is wider than inference_width, faces are found in a
+    downscaled copy (and tracked in downscaled coordinates), and the boxes are
+    scaled back up to match the original frame.
+
+    Args:
+        frame (ndarray): The frame in which to find faces.
+        detector (ExpressionBackend): The backend to use to recognise
+            expressions.
+        tracker (Optional[FaceTracker], optional): Face tracker, if any.
+            Defaults to None.
+        inference_width (int, optional): Width to which to downscale the frame
+            before finding faces. Set to 0 to use the full resolution.
+            Defaults to 0.
+        selector (Optional[PlayerSelector], optional): Selector with which to
+            pick out the player's face. Defaults to None.
+
+    Returns:
+        FERList: List of the emotions as returned by the backend, with the
+            player's face first if a selector is given.
+    """
+    width = frame.shape[1]
+    if 0 < inference_width < width:
+        scale = inference_width / width
+        small = cv2.resize(frame, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_AREA)
+        return [{'box': [round(v / scale) for v in emotions['box']],
+                 'emotions': emotions['emotions']}
+                for emotions in detect_emotions(small, detector, tracker,
+                                                selector=selector)]
+
+    if tracker is not None and not tracker.needs_detection():
+        box = tracker.update(frame)
+        if box is not None:
+            emotions = detector.detect_emotions(frame, face_rectangles=[box])
+            if selector is not None:
+                emotions = selector.select(emotions, frame.shape)
+            return emotions
+
+    emotions = detector.detect_emotions(frame)
+    if selector is not None:
+        emotions = selector.select(emotions, frame.shape)
+    if tracker is not None:
+        tracker.reset(frame, emotions[0]['box'] if emotions else None)
+    return emotions
+
+
+def weigh_expression(emotions: FEREmotions,
+                     happy_weight: float,
+                     surprise_weight: float) -> float:
+    """Calculate the weighted average of the 'happy' and 'surprise' scores.
 
     Args:
         emotions (FEREmotions): Dictionary of emotions as returned by FER.
-        happy_weight (float): Weight to be used for the 'happy' expression when
-            calculating the weighted average.
-        surprise_weight (float): Weight to be used for the 'surprised'
-            expression when calculating the weighted average.
-        low_threshhold (float): Threshold that must be met or exceeded in order
-            for an expression to be classified as a low intensity smile.
-        medium_threshhold (float): Threshold that must be met or exceeded in
-            order for an expression to be classified as a medium intensity
-            smile.
-        high_threshhold (float): Threshold that must be met or exceeded in
-            order for an expression to be classified as a high intensity smile.
+        happy_weight (float): Weight of the 'happy' expression.
+        surprise_weight (float): Weight of the 'surprised' expression.
 
     Returns:
-        EventEnum: EventEnum according to the type of expression detected.
+        float: The weighted average.
     """
-    weighted_average = ((emotions['happy']*happy_weight
-                         + emotions['surprise'] * surprise_weight)
-                        / (happy_weight + surprise_weight))
-    if weighted_average < low_threshhold:
-        return EventEnum.NO_SMILE_DETECTED
-    elif weighted_average < medium_threshhold:
-        return EventEnum.LOW_INTENSITY_SMILE_DETECTED
-    elif weighted_average < high_threshhold:
-        return EventEnum.MEDIUM_INTENSITY_SMILE_DETECTED
-    else:
-        return EventEnum.HIGH_INTENSITY_SMILE_DETECTED
+    return ((emotions['happy']*happy_weight
+             + emotions['surprise'] * surprise_weight)
+            / (happy_weight + surprise_weight))
+
+
+class SmoothedClassifier:
+    """Classify expressions with temporal smoothing and hysteresis.
+
+    The weighted average of each frame is pushed through a streaming smoother
+    (the mean or median of a fixed-size ring buffer of recent averages, or an
+    exponential moving average). The smoothed value must then exceed a
+    threshold by the hysteresis margin to move up a level, or fall below it
+    by the same margin to move down, so that noise near a threshold doesn't
+    make the level flap from frame to frame.
+    """
+
+    levels = (EventEnum.NO_SMILE_DETECTED,
+              EventEnum.LOW_INTENSITY_SMILE_DETECTED,
+              EventEnum.MEDIUM_INTENSITY_SMILE_DETECTED,
+              EventEnum.HIGH_INTENSITY_SMILE_DETECTED)
+
+    def __init__(self,
+                 happy_weight: float,
+                 surprise_weight: float,
+                 low_threshhold: float,
+                 medium_threshhold: float,
+                 high_threshhold: float,
+                 smoothing: str = "none",
+                 window: int = 5,
+                 alpha: float = 0.3,
+                 hysteresis: float = 0.0) -> None:
+        """Initialise the object.
+
+        Args:
+            happy_weight (float): Weight of the 'happy' expression.
+            surprise_weight (float): Weight of the 'surprised' expression.
+            low_threshhold (float): Threshold for a low intensity smile.
+            medium_threshhold (float): Threshold for a medium intensity smile.
+            high_threshhold (float): Threshold for a high intensity smile.
+            smoothing (str, optional): "none", "mean", "median" or "ema".
+                Defaults to "none".
+            window (int, optional): Size of the ring buffer used by the mean
+                and median smoothers. Defaults to 5.
+            alpha (float, optional): Smoothing factor of the exponential
+                moving average. Defaults to 0.3.
+            hysteresis (float, optional): Margin either side of each threshold.
+                Defaults to 0.0.
+
+        Raises:
+            ValueError: If the smoothing method is unknown.
+        """
+        smoothing = smoothing.strip().casefold()
+        if smoothing not in ("none", "mean", "median", "ema"):
+            raise ValueError(f'Unknown smoothing method "{smoothing}".')
+        self._happy_weight = happy_weight
+        self._surprise_weight = surprise_weight
+        self._thresholds = np.array(
+            (low_threshhold, medium_threshhold, high_threshhold))
+        self._smoothing = smoothing
+        self._alpha = alpha
+        self._hysteresis = hysteresis
+        self._buffer = np.zeros(max(window, 1))
+        self._index = 0
+        self._count = 0
+        self._ema: Optional[float] = None
+        self._level = 0
+
+    def reset(self) -> None:
+        """Forget the smoothing history and drop back to the lowest level."""
+        self._buffer[:] = 0
+        self._index = 0
+        self._count = 0
+        self._ema = None
+        self._level = 0
+
+    def smooth(self, value: float) -> float:
+        """Push a new value into the smoother and return the smoothed value.
+
+        Args:
+            value (float): Latest weighted average.
+
+        Returns:
+            float: The smoothed weighted average.
+        """
+        if self._smoothing == "ema":
+            if self._ema is None:
+                self._ema = value
+            else:
+                self._ema += self._alpha * (value - self._ema)
+            return self._ema
+        elif self._smoothing == "none":
+            return value
+        self._buffer[self._index] = value
+        self._index = (self._index + 1) % len(self._buffer)
+        self._count = min(self._count + 1, len(self._buffer))
+        recent = self._buffer[:self._count]
+        if self._smoothing == "median":
+            return float(np.median(recent))
+        return float(recent.mean())
+
+    def __call__(self, emotions: FEREmotions) -> EventEnum:
+        """Classify emotions into no, low, medium, or high intensity smiles.
+
+        Args:
+            emotions (FEREmotions): Dictionary of emotions as returned by FER.
+
+        Returns:
+            EventEnum: EventEnum according to the type of expression detected.
+        """
+        value = self.smooth(weigh_expression(
+            emotions, self._happy_weight, self._surprise_weight))
+        up = int(np.count_nonzero(
+            value >= self._thresholds + self._hysteresis))
+        down = int(np.count_nonzero(
+            value >= self._thresholds - self._hysteresis))
+        if up > self._level:
+            self._level = up
+        elif down < self._level:
+            self._level = down
+        return self.levels[self._level]
 
 
 def do_show(frame: ndarray, emotions_list: FERList) -> None:
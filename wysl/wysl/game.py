@@ -7,18 +7,24 @@ from configparser import ConfigParser
 from functools import partial
 from multiprocessing.connection import Connection, PipeConnection
 from queue import Empty, Queue
+from typing import Any, Optional
 
-from .arduino import arduino_loop
+from .arduino import ArduinoQueue, arduino_loop
+from .channel import (EXPRESSION_RECORD, LAUGHTER_RECORD, ChannelConnection,
+                      format_features)
 from .enums import (ChannelEnum, CommandEnum, DirectionEnum, ErrorEnum,
                     EventEnum, LocationEnum)
-from .exceptions import (CameraError, GameOverException, MicrophoneError,
-                         NetworkError, SerialError, UserTerminationException)
+from .exceptions import (CameraError, ConfigError, GameOverException,
+                         MicrophoneError, ModelError, NetworkError,
+                         SerialError, UserTerminationException)
 from .expression import expression_loop
+from .instrumentation import Instrumentation, StatsSummary, format_stats
 from .keyboard import keyboard_loop
 from .laughter import laughter_loop
 from .network import network_loop
+from .pool import WorkerPool
 from .types import (ChannelSetter, EventHandler, ITCQueue, Payload, Pipes,
-                    Queues)
+                    Queues, StatsReport, TimedEvent)
 from .utils import box_strings
 
 logger = mp.log_to_stderr()
@@ -26,37 +32,63 @@ logger = mp.log_to_stderr()
 
 set_arduino_channel: ChannelSetter
 in_game = False
+# Timing statistics reported by each process during the most recent game.
+stats: dict[str, StatsSummary] = {}
+# Names of the pipes whose processes have reported that they're ready.
+ready_workers: set[str] = set()
+detectors_ready = False
+timer = Instrumentation()
+# Latest features (scores, volumes, etc) of each detection process, when
+# they're sent over shared memory channels, for display with the statistics.
+features: dict[str, Any] = {}
 
 
-def game_loop(config: ConfigParser) -> None:
-    """Run the primary game loop."""
-    global set_arduino_channel, pulse_interval, pulse
+def game_loop(config: ConfigParser,
+              pool: Optional[WorkerPool] = None) -> None:
+    """Run the primary game loop.
+
+    Args:
+        config (ConfigParser): Game configuration.
+        pool (Optional[WorkerPool], optional): Pool in which to keep the
+            detection processes between games, if [game] keep_warm is set. If
+            None, or keep_warm isn't set, the processes are started for this
+            game only. Defaults to None.
+    """
+    global set_arduino_channel, pulse_interval, pulse, timer, detectors_ready
     # Configuration sections for easier access
     arduino_cfg = config["arduino"]
     expression_cfg = config['expression']
     laughter_cfg = config["laughter"]
     network_cfg = config['network']
     game_cfg = config['game']
+    stats_interval = game_cfg.getfloat("stats_interval")
+    stats.clear()
+    timer = Instrumentation(enabled=stats_interval > 0)
+    ready_workers.clear()
+    detectors_ready = False
+    features.clear()
+    shared = game_cfg.get("transport") == "shm"
+    keep_warm = pool is not None and game_cfg.getboolean("keep_warm")
+    if pool is not None and not keep_warm:
+        # Don't leave workers from an earlier game paused in the background.
+        pool.close()
+    if pool is None or not keep_warm:
+        pool = WorkerPool()
 
     # IPC and ITC communication constructs
     # Create ITC queues
     input_queue: ITCQueue = Queue()
-    arduino_queue: ITCQueue = Queue()
+    arduino_queue = ArduinoQueue()
+    serial_queue: ITCQueue = Queue()
     network_queue: ITCQueue = Queue()
+    # The Arduino thread has the ArduinoQueue to itself, and reports errors
+    # on the SerialQueue.
     queues: Queues = {
-        "ArduinoQueue": arduino_queue,
+        "SerialQueue": serial_queue,
         "NetworkQueue": network_queue,
         "KeyboardQueue": input_queue,
     }
 
-    # Create IPC pipes
-    expression_pipe_local, expression_pipe_remote = mp.Pipe()
-    laughter_pipe_local, laughter_pipe_remote = mp.Pipe()
-    local_pipes = {
-        "ExpressionPipe": expression_pipe_local,
-        "LaughterPipe": laughter_pipe_local
-    }
-
     # Create threads
     kb_thread = threading.Thread(
         target=keyboard_loop,
@@ -71,8 +103,12 @@ def game_loop(config: ConfigParser) -> None:
         name="ArduinoThread",
         kwargs={
             "queue": arduino_queue,
+            "errors": serial_queue,
             "port": arduino_cfg.get("port"),
-            "baudrate": arduino_cfg.getint("baudrate")
+            "baudrate": arduino_cfg.getint("baudrate"),
+            "stats_interval": stats_interval,
+            "timer": timer,
+            "verify_interval": arduino_cfg.getfloat("verify_interval")
         })
 
     network_thread = threading.Thread(
@@ -86,32 +122,61 @@ def game_loop(config: ConfigParser) -> None:
             "remote_port": network_cfg.getint("remote_port")
         })
 
-    # Create processes
-    expression_proc = mp.Process(
-        name="ExpressionProcess",
-        target=expression_loop,
-        kwargs={
-            "pipe": expression_pipe_remote,
-            "mtcnn": expression_cfg.getboolean("mtcnn"),
-            "camera_index": expression_cfg.getint("camera_index"),
-            "happy_weight": expression_cfg.getfloat("happy_weight"),
-            "surprise_weight": expression_cfg.getfloat("surprise_weight"),
-            "low_threshhold": expression_cfg.getfloat("low_threshhold"),
-            "medium_threshhold": expression_cfg.getfloat("medium_threshhold"),
-            "high_threshhold": expression_cfg.getfloat("high_threshhold")
-        })
+    # Process arguments
+    expression_kwargs = {
+        "mtcnn": expression_cfg.getboolean("mtcnn"),
+        "camera_index": expression_cfg.getint("camera_index"),
+        "happy_weight": expression_cfg.getfloat("happy_weight"),
+        "surprise_weight": expression_cfg.getfloat("surprise_weight"),
+        "low_threshhold": expression_cfg.getfloat("low_threshhold"),
+        "medium_threshhold": expression_cfg.getfloat("medium_threshhold"),
+        "high_threshhold": expression_cfg.getfloat("high_threshhold"),
+        "tracking": expression_cfg.getboolean("tracking"),
+        "redetect_interval": expression_cfg.getint("redetect_interval"),
+        "tracking_confidence": expression_cfg.getfloat(
+            "tracking_confidence"),
+        "backend": expression_cfg.get("backend"),
+        "model_path": expression_cfg.get("model_path"),
+        "heartbeat": expression_cfg.getfloat("heartbeat"),
+        "smoothing": expression_cfg.get("smoothing"),
+        "smoothing_window": expression_cfg.getint("smoothing_window"),
+        "smoothing_alpha": expression_cfg.getfloat("smoothing_alpha"),
+        "hysteresis": expression_cfg.getfloat("hysteresis"),
+        "headless": expression_cfg.getboolean("headless"),
+        "viewer": expression_cfg.getboolean("viewer"),
+        "viewer_fps": expression_cfg.getfloat("viewer_fps"),
+        "source": expression_cfg.get("source"),
+        "inference_width": expression_cfg.getint("inference_width"),
+        "target_fps": expression_cfg.getfloat("target_fps"),
+        "stats_interval": stats_interval,
+        "warmup": expression_cfg.getint("warmup"),
+        "player_policy": expression_cfg.get("player_policy")
+    }
 
-    laughter_proc = mp.Process(
-        name="LaughterProcess",
-        target=laughter_loop,
-        kwargs={
-            "pipe": laughter_pipe_remote,
-            "microphone_index": laughter_cfg.getint("microphone_index"),
-            "chunk_duration": laughter_cfg.getfloat("chunk_duration"),
-            "laughter_threshhold": laughter_cfg.getfloat("threshhold"),
-            "records": laughter_cfg.getint("records"),
-            "hits": laughter_cfg.getint("hits")
-        })
+    laughter_kwargs = {
+        "microphone_index": laughter_cfg.getint("microphone_index"),
+        "chunk_duration": laughter_cfg.getfloat("chunk_duration"),
+        "laughter_threshhold": laughter_cfg.getfloat("threshhold"),
+        "records": laughter_cfg.getint("records"),
+        "hits": laughter_cfg.getint("hits"),
+        "heartbeat": laughter_cfg.getfloat("heartbeat"),
+        "stats_interval": stats_interval,
+        "buffer_duration": laughter_cfg.getfloat("buffer_duration"),
+        "duty_cycle": laughter_cfg.getfloat("duty_cycle"),
+        "detector": laughter_cfg.get("detector"),
+        "rhythm_threshhold": laughter_cfg.getfloat("rhythm_threshhold"),
+        "source": laughter_cfg.get("source"),
+        "headless": laughter_cfg.getboolean("headless"),
+        "plot_fps": laughter_cfg.getfloat("plot_fps"),
+        "passthrough": laughter_cfg.getboolean("passthrough"),
+        "sample_rate": laughter_cfg.getint("sample_rate"),
+        "hop_duration": laughter_cfg.getfloat("hop_duration"),
+        "profile": laughter_cfg.get("profile"),
+        "adaptive_threshhold": laughter_cfg.getboolean("adaptive_threshhold"),
+        "noise_k": laughter_cfg.getfloat("noise_k"),
+        "noise_halflife": laughter_cfg.getfloat("noise_halflife"),
+        "noise_hit_weight": laughter_cfg.getfloat("noise_hit_weight")
+    }
 
     # Partials for convenience
     set_arduino_channel = partial(switch_channel, arduino_queue)
@@ -128,11 +193,16 @@ def game_loop(config: ConfigParser) -> None:
         squeeze_duration=game_cfg.getfloat("squeeze_duration")
     )
 
-    # Start and join all threads and processes
-    expression_proc.start()
-    expression_proc.join(0)
-    laughter_proc.start()
-    laughter_proc.join(0)
+    # Start (or resume) all processes and start and join all threads
+    local_pipes = {
+        "ExpressionPipe": pool.start(
+            "ExpressionProcess", expression_loop, expression_kwargs,
+            record=EXPRESSION_RECORD if shared else None),
+        "LaughterPipe": pool.start(
+            "LaughterProcess", laughter_loop, laughter_kwargs,
+            record=LAUGHTER_RECORD if shared else None)
+    }
+    print("Waiting for the detectors to warm up...")
     kb_thread.start()
     kb_thread.join(0)
     arduino_thread.start()
@@ -153,6 +223,12 @@ def game_loop(config: ConfigParser) -> None:
         except MicrophoneError:
             logger.info("Shutting down due to microphone error.")
             break
+        except ModelError:
+            logger.info("Shutting down due to expression model error.")
+            break
+        except ConfigError:
+            logger.info("Shutting down due to configuration error.")
+            break
         except SerialError:
             logger.info("Shutting down due to serial error.")
             break
@@ -169,29 +245,57 @@ def game_loop(config: ConfigParser) -> None:
         # if not (expression_proc.is_alive() or laughter_proc.is_alive()):
             # break
 
-    shutdown(local_pipes, queues)
+    shutdown(pool, {**queues, "ArduinoQueue": arduino_queue}, keep_warm)
 
 
 def handle_ipc_recv(pipes: Pipes,
                     event_handler: EventHandler) -> None:
     """Handle inter-process communication in the receive direction."""
-    global set_arduino_channel
+    global set_arduino_channel, detectors_ready
     ready = mp.connection.wait(pipes.values(), 0)
-    for pipe in ready:
-        if not isinstance(pipe, (Connection, PipeConnection)):
+    for name, pipe in pipes.items():
+        if (pipe not in ready
+                or not isinstance(pipe, (Connection, PipeConnection,
+                                         ChannelConnection))):
             continue
-        payload = pipe.recv()
-        logger.info(f'Received from {pipe}: {payload}')
-        if payload is ErrorEnum.CAMERA_ERROR:
-            logger.error("Problem with the camera.")
-            raise CameraError
-        elif payload is ErrorEnum.MICROPHONE_ERROR:
-            logger.error("Problem with the microphone.")
-            raise MicrophoneError
-        elif payload is CommandEnum.TERMINATE:
-            raise UserTerminationException
-        elif isinstance(payload, EventEnum):
-            event_handler(event=payload, location=LocationEnum.LOCAL)
+        # A channel's doorbell may stand for many records, so drain it.
+        while pipe.poll(0):
+            payload = pipe.recv()
+            if (isinstance(payload, TimedEvent)
+                    and payload.features is not None):
+                features[name] = payload.features
+                if payload.event is None:
+                    # Features only; the worker held the event back.
+                    continue
+            logger.info(f'Received from {pipe}: {payload}')
+            if isinstance(payload, StatsReport):
+                stats[payload.source] = payload.summary
+                continue
+            elif isinstance(payload, TimedEvent):
+                # Time from capture of the frame or chunk to receipt here.
+                timer.record(name, time.monotonic() - payload.timestamp)
+                payload = payload.event
+            if payload is ErrorEnum.CAMERA_ERROR:
+                logger.error("Problem with the camera.")
+                raise CameraError
+            elif payload is ErrorEnum.MICROPHONE_ERROR:
+                logger.error("Problem with the microphone.")
+                raise MicrophoneError
+            elif payload is ErrorEnum.MODEL_ERROR:
+                logger.error("Problem with the expression model.")
+                raise ModelError
+            elif payload is ErrorEnum.CONFIG_ERROR:
+                logger.error("Problem with the configuration.")
+                raise ConfigError
+            elif payload is CommandEnum.TERMINATE:
+                raise UserTerminationException
+            elif payload is CommandEnum.READY:
+                ready_workers.add(name)
+                if not detectors_ready and ready_workers >= set(pipes):
+                    detectors_ready = True
+                    print("Detectors ready. Type 'start' to begin.")
+            elif isinstance(payload, EventEnum):
+                event_handler(event=payload, location=LocationEnum.LOCAL)
 
 
 def handle_itc_recv(queues: Queues,
@@ -212,6 +316,10 @@ def handle_itc_recv(queues: Queues,
                 raise NetworkError
             elif payload is CommandEnum.TERMINATE:
                 raise UserTerminationException
+            elif payload is CommandEnum.SHOW_STATS:
+                print(get_stats())
+            elif payload is CommandEnum.START and not detectors_ready:
+                print("The detectors are still warming up, please wait.")
             elif payload is CommandEnum.START:
                 queues["NetworkQueue"].put(
                     Payload(EventEnum.START_GAME, DirectionEnum.SEND))
@@ -254,7 +362,7 @@ def handle_event(arduino_queue: ITCQueue,
                                 else "Better luck next time.")
     elif event is EventEnum.LAUGHTER_DETECTED:
         set_arduino_channel(channel=balloon_channel,
-                            state=CommandEnum.CHANNEL_ON)
+                            state=CommandEnum.CHANNEL_ON, urgent=True)
         time.sleep(squeeze_duration)
         network_queue.put(Payload(EventEnum.GAME_OVER, DirectionEnum.SEND))
         raise GameOverException("Better luck next time.")
@@ -285,28 +393,50 @@ def handle_event(arduino_queue: ITCQueue,
                                 interval=speed)
 
 
-def shutdown(pipes: Pipes, queues: Queues) -> None:
-    """Shutdown the game."""
+def get_stats() -> str:
+    """Get the timing statistics of the current or most recent game.
+
+    The latest features from each detection process are included too, if
+    they're sent over shared memory channels.
+    """
+    summaries = dict(stats)
+    if timer.stages or timer.gauges:
+        summaries[mp.current_process().name] = timer.summary()
+    if not features:
+        return format_stats(summaries)
+    return format_stats(summaries) + "\n" + format_features(features)
+
+
+def shutdown(pool: WorkerPool, queues: Queues, keep_warm: bool) -> None:
+    """Shutdown the game.
+
+    The detection processes are paused if they are to be kept warm for the
+    next game, and terminated otherwise.
+    """
     global set_arduino_channel, in_game
     # print("Shutting down.")
     for i in range(1, 5):
-        set_arduino_channel(i, CommandEnum.PULSE_CHANNEL, 0)
-        set_arduino_channel(i, CommandEnum.CHANNEL_OFF)
-    for name, pipe in pipes.items():
-        try:
-            pipe.send(CommandEnum.TERMINATE)
-        except (OSError, BrokenPipeError):
-            continue
+        set_arduino_channel(i, CommandEnum.PULSE_CHANNEL, 0, urgent=True)
+        set_arduino_channel(i, CommandEnum.CHANNEL_OFF, urgent=True)
+    if keep_warm:
+        pool.pause()
+    else:
+        pool.close()
     for name, queue in queues.items():
         queue.put_nowait(Payload(CommandEnum.TERMINATE))
     in_game = False
 
 
-def switch_channel(queue: ITCQueue,
+def switch_channel(queue: ArduinoQueue,
                    channel: int,
                    state: CommandEnum,
-                   interval: int = 0) -> None:
-    """Set the arduino channel."""
+                   interval: int = 0,
+                   urgent: bool = False) -> None:
+    """Set (or query the state of) the arduino channel.
+
+    Urgent commands (switching EMS off, squeezing the balloon) jump ahead of
+    any others still waiting to be sent.
+    """
     # print(f'Controling arduino: {channel!r} {state!r} {interval!r}')
     if channel == 1:
         ch = ChannelEnum.CHANNEL_1
@@ -318,11 +448,16 @@ def switch_channel(queue: ITCQueue,
         ch = ChannelEnum.CHANNEL_4
     else:
         return
-    if state == CommandEnum.CHANNEL_ON or state == CommandEnum.CHANNEL_OFF:
+    if (state == CommandEnum.CHANNEL_ON or state == CommandEnum.CHANNEL_OFF
+            or state == CommandEnum.QUERY_CHANNEL):
         # print(f'Executing command: {state} {ch}')
-        queue.put_nowait(Payload(state, ch))
+        payload = Payload(state, ch)
     elif state == CommandEnum.PULSE_CHANNEL:
         # print(f'Executing: {state} {ch} {interval}')
-        queue.put_nowait(Payload(state, (ch, interval)))
+        payload = Payload(state, (ch, interval))
     else:
         return
+    if urgent:
+        queue.put_urgent(payload)
+    else:
+        queue.put_nowait(payload)
@@ -0,0 +1,187 @@
+"""Streaming hit counting for laughter detection.
+
+Laughter is detected when enough of the recent audio chunks are loud enough.
+Rather than re-counting the whole window for every chunk, a `HitCounter`
+keeps a running count of hits, which is updated as each chunk enters the
+window and the oldest leaves it, so the cost per chunk doesn't depend on the
+length of the window.
+
+The threshhold for a hit can be fixed, or can follow the ambient noise as
+estimated by a `NoiseFloor`.
+"""
+
+import math
+
+
+class HitCounter:
+    """Running count of hits over a sliding window of volumes.
+
+    The counter is triggered once the window is full and at least `required`
+    of the volumes in it were hits. This can be given either as a number of
+    hits ("k of the last n") or as a fraction of the window (a duty cycle).
+
+    Attributes:
+        size (int): Number of recent volumes in the window.
+        hit_volume (float): Minimum volume for a hit. It can be changed at any
+            time, and applies to volumes added from then on.
+        required (int): Number of hits in the window needed to trigger.
+        hits (int): Number of hits currently in the window.
+        last (float): The most recently added volume.
+    """
+
+    def __init__(self,
+                 size: int,
+                 hit_volume: float,
+                 min_hits: int = 0,
+                 duty_cycle: float = 0.0) -> None:
+        """Initialise the object.
+
+        Args:
+            size (int): Number of recent volumes to consider.
+            hit_volume (float): Minimum volume for a hit.
+            min_hits (int, optional): Number of hits in the window required
+                to trigger. Defaults to 0.
+            duty_cycle (float, optional): Fraction of the window that must be
+                hits in order to trigger. If given, this takes precedence over
+                min_hits. Defaults to 0.0.
+
+        Raises:
+            ValueError: If the window is empty, or the requirement can't be
+                met within it.
+        """
+        if size < 1:
+            raise ValueError("The window must hold at least one volume.")
+        if duty_cycle > 0:
+            min_hits = math.ceil(duty_cycle * size)
+        if not 0 < min_hits <= size:
+            raise ValueError(f'Cannot require {min_hits} hits in a window of '
+                             f'{size}.')
+        self.size = size
+        self.hit_volume = hit_volume
+        self.required = min_hits
+        self._window = [False] * size
+        self._index = 0
+        self._count = 0
+        self.hits = 0
+        self.last = 0.0
+
+    @property
+    def full(self) -> bool:
+        """Whether a whole window of volumes has been added."""
+        return self._count == self.size
+
+    @property
+    def triggered(self) -> bool:
+        """Whether the window is full and holds enough hits."""
+        return self.full and self.hits >= self.required
+
+    def add(self, volume: float) -> bool:
+        """Add a volume to the window, dropping the oldest if it's full.
+
+        Returns:
+            bool: Whether the counter is now triggered.
+        """
+        hit = volume >= self.hit_volume
+        index = self._index
+        if self._count == self.size:
+            self.hits -= self._window[index]
+        else:
+            self._count += 1
+        self._window[index] = hit
+        self.hits += hit
+        self._index = (index + 1) % self.size
+        self.last = volume
+        return self.triggered
+
+    def clear(self) -> None:
+        """Empty the window."""
+        self._window = [False] * self.size
+        self._index = 0
+        self._count = 0
+        self.hits = 0
+        self.last = 0.0
+
+
+class NoiseFloor:
+    """Running estimate of the background volume, and a threshhold above it.
+
+    The mean and variance of the volume are tracked with exponentially
+    weighted (Welford-style) updates, so the estimate follows the ambient
+    noise as it changes over a session, at constant cost per volume. The
+    threshhold is `mean + k * stddev`.
+
+    Volumes at or above the threshhold are probably laughter rather than
+    noise, so by default they're left out of the estimate altogether, and
+    long laughter doesn't raise the threshhold it's judged against. Giving
+    them a small weight instead lets the estimate recover if the noise rises
+    above the threshhold for good.
+
+    Attributes:
+        threshhold (float): The current threshhold.
+        mean (float): Estimated mean volume of the background.
+        stddev (float): Estimated standard deviation of the background volume.
+    """
+
+    def __init__(self,
+                 threshhold: float,
+                 k: float = 3.0,
+                 halflife: float = 30.0,
+                 interval: float = 0.05,
+                 hit_weight: float = 0.0) -> None:
+        """Initialise the object.
+
+        Args:
+            threshhold (float): Threshhold to use until enough volumes have
+                been seen to estimate it.
+            k (float, optional): Number of standard deviations above the mean
+                at which to set the threshhold. Defaults to 3.0.
+            halflife (float, optional): Time, in seconds, after which a
+                volume has half its original weight in the estimate.
+                Defaults to 30.0.
+            interval (float, optional): Time, in seconds, between volumes.
+                Defaults to 0.05.
+            hit_weight (float, optional): Weight of volumes at or above the
+                threshhold, relative to the rest. Set to 0 to leave them out.
+                Defaults to 0.0.
+        """
+        self.k = k
+        self.hit_weight = hit_weight
+        self._initial = threshhold
+        self._alpha = 1 - 0.5 ** (interval / halflife)
+        # Until a halflife's worth of volumes has been seen, the estimate is
+        # too uncertain to use.
+        self._min_count = max(round(halflife / interval), 1)
+        self.clear()
+
+    @property
+    def stddev(self) -> float:
+        """Estimated standard deviation of the background volume."""
+        return math.sqrt(self._variance)
+
+    def update(self, volume: float) -> float:
+        """Add a volume to the estimate.
+
+        Returns:
+            float: The new threshhold.
+        """
+        weight = 1.0
+        if volume >= self.threshhold and self._count >= self._min_count:
+            if self.hit_weight <= 0:
+                return self.threshhold
+            weight = self.hit_weight
+        self._count += 1
+        # Weight the first volumes equally, as a plain running mean would.
+        alpha = max(self._alpha, 1 / self._count) * weight
+        delta = volume - self.mean
+        self.mean += alpha * delta
+        self._variance = (1 - alpha) * (self._variance + alpha * delta**2)
+        if self._count >= self._min_count:
+            self.threshhold = self.mean + self.k * self.stddev
+        return self.threshhold
+
+    def clear(self) -> None:
+        """Forget the estimate, and go back to the initial threshhold."""
+        self.threshhold = self._initial
+        self.mean = 0.0
+        self._variance = 0.0
+        self._count = 0
@@ -0,0 +1,174 @@
+"""Low-overhead latency instrumentation.
+
+Each process keeps an `Instrumentation` object, and marks the boundaries of
+the stages of its pipeline with it as it goes. The time spent in each stage is
+kept in a fixed-size ring buffer of recent samples (a `LatencyHistogram`), so
+that percentiles over the recent past can be reported without the cost
+growing over a session.
+
+Summaries are plain dictionaries of floats, so they can be sent between
+processes, logged, and shown from the command line.
+"""
+
+import time
+from typing import Mapping, Optional
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+StageSummary = dict[str, float]
+StatsSummary = dict[str, StageSummary]
+
+
+class LatencyHistogram:
+    """Rolling window of latency samples for a single stage."""
+
+    def __init__(self, size: int = 1024) -> None:
+        """Initialise the object.
+
+        Args:
+            size (int, optional): Number of recent samples to keep.
+                Defaults to 1024.
+        """
+        self._samples = np.zeros(size)
+        self._index = 0
+        self._count = 0
+        self.total = 0
+
+    def add(self, seconds: float) -> None:
+        """Record a sample."""
+        self._samples[self._index] = seconds
+        self._index = (self._index + 1) % len(self._samples)
+        self._count = min(self._count + 1, len(self._samples))
+        self.total += 1
+
+    def summary(self) -> StageSummary:
+        """Summarise the recent samples.
+
+        Returns:
+            StageSummary: Total number of samples, and the percentiles and
+                maximum of the recent samples, in milliseconds.
+        """
+        summary: StageSummary = {"count": float(self.total)}
+        if self._count == 0:
+            return summary
+        recent = self._samples[:self._count] * 1000
+        for p, value in zip(PERCENTILES, np.percentile(recent, PERCENTILES)):
+            summary[f'p{p}'] = float(value)
+        summary["max"] = float(recent.max())
+        return summary
+
+
+class Instrumentation:
+    """Per-stage timing for a pipeline.
+
+    Call `start` at the beginning of each pass through the pipeline, then
+    `mark` at the end of each stage. Values that aren't latencies (counters,
+    thresholds, etc) can be attached as gauges with `gauge`.
+    """
+
+    def __init__(self, enabled: bool = True, size: int = 1024) -> None:
+        """Initialise the object.
+
+        Args:
+            enabled (bool, optional): Whether to record anything. A disabled
+                object can be passed around where timing isn't wanted.
+                Defaults to True.
+            size (int, optional): Number of recent samples to keep per stage.
+                Defaults to 1024.
+        """
+        self.enabled = enabled
+        self._size = size
+        self._last = 0.0
+        self.stages: dict[str, LatencyHistogram] = {}
+        self.gauges: dict[str, float] = {}
+
+    def start(self, timestamp: Optional[float] = None) -> None:
+        """Mark the start of a pass through the pipeline.
+
+        Args:
+            timestamp (Optional[float], optional): Time (as returned by
+                `time.monotonic`) at which the pass started. If None, now.
+                Defaults to None.
+        """
+        if self.enabled:
+            self._last = time.monotonic() if timestamp is None else timestamp
+
+    def mark(self, stage: str) -> None:
+        """Mark the end of a stage, which began at the previous mark."""
+        if self.enabled:
+            now = time.monotonic()
+            self.record(stage, now - self._last)
+            self._last = now
+
+    def record(self, stage: str, seconds: float) -> None:
+        """Record a latency sample for a stage directly."""
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram(self._size)
+        histogram.add(seconds)
+
+    def gauge(self, name: str, value: float) -> None:
+        """Set the current value of a gauge."""
+        if self.enabled:
+            self.gauges[name] = value
+
+    def summary(self) -> StatsSummary:
+        """Summarise all stages and gauges.
+
+        Returns:
+            StatsSummary: Summaries keyed by stage name. Gauges are gathered
+                under the key "gauges".
+        """
+        # Stages may be added from another thread (e.g. a GUI thread).
+        summary = {name: histogram.summary()
+                   for name, histogram in list(self.stages.items())}
+        if self.gauges:
+            summary["gauges"] = dict(self.gauges)
+        return summary
+
+
+# Shared disabled instance, for use as a default argument.
+NO_INSTRUMENTATION = Instrumentation(enabled=False)
+
+
+def format_summary(summary: StatsSummary) -> str:
+    """Format a summary as a single log line."""
+    parts = []
+    for stage, values in summary.items():
+        if stage == "gauges":
+            parts.extend(f'{name}={value:g}' for name, value in values.items())
+        elif "p50" in values:
+            parts.append(f'{stage}(p50/p99/max)={values["p50"]:.1f}/'
+                         f'{values["p99"]:.1f}/{values["max"]:.1f}ms')
+    return " ".join(parts)
+
+
+def format_stats(stats: Mapping[str, StatsSummary]) -> str:
+    """Tabulate summaries from several processes for display.
+
+    Args:
+        stats (Mapping[str, StatsSummary]): Summaries keyed by process name.
+
+    Returns:
+        str: The table.
+    """
+    if not stats:
+        return "No statistics have been collected yet."
+    lines = []
+    for name, summary in stats.items():
+        lines.append(f'{name}:')
+        for stage, values in summary.items():
+            if stage == "gauges":
+                lines.extend(f'  {gauge:<16}{value:g}'
+                             for gauge, value in values.items())
+            elif "p50" in values:
+                lines.append(
+                    f'  {stage:<16}' + "  ".join(
+                        f'p{p}={values[f"p{p}"]:7.2f}' for p in PERCENTILES)
+                    + f'  max={values["max"]:7.2f}ms'
+                    f'  n={values["count"]:.0f}')
+    return "\n".join(lines)
@@ -18,5 +18,7 @@ def keyboard_loop(queue: ITCQueue) -> None:
             break
         elif received == "start":
             queue.put(Payload(CommandEnum.START))
+        elif received == "stats":
+            queue.put(Payload(CommandEnum.SHOW_STATS))
         else:
             print("I beg your pardon?")
@@ -1,179 +1,604 @@
-"""Laughter detection component of the game."""
+"""Laughter detection component of the game.
 
-import audioop
+Audio is captured by an `AudioCapture` ring buffer, which is filled from the
+PyAudio callback. Each pass of the detection loop analyses every chunk that
+has arrived since the last pass in one go. The waveform is plotted by a
+`WaveformPlot` on the main thread while detection runs on a thread of its
+own, so the plot never holds detection up (and can be turned off entirely).
+
+With `adaptive_threshhold`, the threshhold for a hit follows the ambient
+noise through the session (see `NoiseFloor`), rather than staying at the
+value measured during setup.
+
+The volume is measured over windows of `chunk_duration`, and updated every
+hop. By default the two are equal, but the low latency profile (or a shorter
+`hop_duration`) has the windows overlap, so laughter can be reacted to
+sooner without the volume becoming noisier. The hit window is scaled to
+match, so that it covers the same length of time whatever the hop.
+
+By default, laughter is any sufficiently sustained loud sound (see
+`classify_sound`). The spectral detector additionally requires the loudness
+of the voice band to pulse at the 4-6 Hz syllable rate of laughter (see
+`SpectralDetector`), which rejects most speech, claps and background noise.
+"""
+
+import math
 import multiprocessing as mp
-from collections import deque
+import threading
+import time
 from multiprocessing.connection import Connection
+from typing import Callable, NamedTuple, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pyaudio
 from matplotlib.backend_bases import CloseEvent
-from matplotlib.figure import Figure
 
-from .enums import CommandEnum, EventEnum
-from .types import FloatDeque
+from .analysis import (OverlappingWindows, as_chunks, band_energies,
+                       modulation_ratio)
+from .audio import AudioCapture, WaveStream, read_wave_source
+from .channel import ChannelWriter
+from .emission import EmissionPolicy
+from .enums import CommandEnum, ErrorEnum, EventEnum
+from .exceptions import MicrophoneError
+from .hits import HitCounter, NoiseFloor
+from .instrumentation import (NO_INSTRUMENTATION, Instrumentation,
+                              format_summary)
+from .pool import wait_for_resume
+from .types import StatsReport, TimedEvent
+from .waveform import WaveformPlot
 
 logger = mp.get_logger()
 running: bool
 
+# Number of hops per analysis window for each latency profile, when
+# hop_duration isn't given.
+LATENCY_PROFILES = {"standard": 1, "low_latency": 4}
+
+
+class AnalysisSettings(NamedTuple):
+    """Sizes of the analysis windows and hit window, in samples and hops."""
+
+    window: int
+    hop: int
+    records: int
+    hits: int
+
+
+def analysis_settings(rate: int,
+                      chunk_duration: float,
+                      hop_duration: float,
+                      profile: str,
+                      records: int,
+                      hits: int) -> AnalysisSettings:
+    """Work out the analysis window and hop sizes.
+
+    Records and hits are given in chunks, as if the windows didn't overlap.
+    They are scaled to the hop, so that the hit window covers the same time.
+
+    Args:
+        rate (int): Sample rate, in Hz.
+        chunk_duration (float): Duration of each analysis window, in seconds.
+        hop_duration (float): Interval between analyses, in seconds. If 0,
+            it is set by the profile.
+        profile (str): Latency profile, either "standard" or "low_latency".
+        records (int): Number of chunks in the hit window.
+        hits (int): Number of hits required in the hit window.
+
+    Raises:
+        ValueError: If the profile is unknown, or the hop is longer than the
+            window.
+
+    Returns:
+        AnalysisSettings: The sizes.
+    """
+    window = int(rate * chunk_duration)
+    if hop_duration > 0:
+        hop = int(rate * hop_duration)
+    else:
+        try:
+            hop = window // LATENCY_PROFILES[profile.strip().casefold()]
+        except KeyError:
+            raise ValueError(f'Unknown latency profile "{profile}".') from None
+    if not 0 < hop <= window:
+        raise ValueError("The hop must be no longer than the chunk.")
+    scale = window / hop
+    scaled_records = round(records * scale)
+    if 0 < hits <= records:
+        # Keep the configured fraction of hits, without rounding past the
+        # scaled window.
+        hits = min(scaled_records, math.ceil(hits * scaled_records / records))
+    else:
+        hits = math.ceil(hits * scale)
+    return AnalysisSettings(window, hop, scaled_records, hits)
+
 
 def laughter_loop(pipe: Connection,
                   microphone_index: int,
                   chunk_duration: float,
                   laughter_threshhold: float,
                   records: int,
-                  hits: int) -> None:
+                  hits: int,
+                  heartbeat: float = 1.0,
+                  stats_interval: float = 10.0,
+                  buffer_duration: float = 2.0,
+                  duty_cycle: float = 0.0,
+                  detector: str = "rms",
+                  rhythm_threshhold: float = 0.4,
+                  source: str = "",
+                  headless: bool = False,
+                  plot_fps: float = 15.0,
+                  passthrough: bool = True,
+                  sample_rate: int = 16000,
+                  hop_duration: float = 0.0,
+                  profile: str = "standard",
+                  adaptive_threshhold: bool = False,
+                  noise_k: float = 3.0,
+                  noise_halflife: float = 30.0,
+                  noise_hit_weight: float = 0.0,
+                  channel: Optional[ChannelWriter] = None) -> None:
     """Laughter detection loop.
 
+    Once the audio stream has started, CommandEnum.READY is sent to the parent
+    process. The loop can be paused with CommandEnum.PAUSE, after which it
+    sends nothing until it is resumed with CommandEnum.START (at which point it
+    is READY again).
+
     Args:
         pipe (Connection): Pipe for communication with the parent process.
         microphone_index (int): Index of the input device to use, as
             understood by pyaudio.
-        chunk_duration (float): Duration of audio segments.
+        chunk_duration (float): Duration of the audio analysed for each
+            volume measurement.
         laughter_threshhold (float): Minimum volume required for a hit to be
             recorded.
-        records (int): Number of recent volume records to keep.
+        records (int): Number of recent volume records to keep, counted in
+            chunks. It's scaled if the hop is shorter than a chunk.
         hits (int): Number of hits in recent records required to trigger
-            laughter detection.
+            laughter detection, likewise counted in chunks.
+        heartbeat (float, optional): Interval, in seconds, at which to re-send
+            an unchanged classification. Set to 0 to only send changes.
+            Defaults to 1.0.
+        stats_interval (float, optional): Interval, in seconds, at which to log
+            timing statistics and report them to the parent process. Set to 0
+            to disable instrumentation. Defaults to 10.0.
+        buffer_duration (float, optional): Duration, in seconds, of audio that
+            can be held while waiting to be analysed. Defaults to 2.0.
+        duty_cycle (float, optional): Fraction of recent records that must be
+            hits to trigger laughter detection. If given, this takes
+            precedence over hits. Defaults to 0.0.
+        detector (str, optional): Laughter detector to use, either "rms" or
+            "spectral". Defaults to "rms".
+        rhythm_threshhold (float, optional): Minimum share of the voice
+            band's modulation that must be at the syllable rate of laughter
+            for the spectral detector to detect laughter. Defaults to 0.4.
+        source (str, optional): Path to a WAV file or directory of WAV files
+            to play back in real time instead of using the microphone.
+            Defaults to "".
+        headless (bool, optional): Whether to skip plotting the waveform.
+            Defaults to False.
+        plot_fps (float, optional): Maximum rate at which to redraw the
+            waveform plot. Defaults to 15.0.
+        passthrough (bool, optional): Whether to play the microphone feed
+            back through the speakers. Defaults to True.
+        sample_rate (int, optional): Sample rate at which to capture audio,
+            in Hz. Recordings are analysed at their own rate.
+            Defaults to 16000.
+        hop_duration (float, optional): Interval, in seconds, between volume
+            measurements. If 0, it is set by the profile. Defaults to 0.0.
+        profile (str, optional): Latency profile, either "standard" (one
+            measurement per chunk) or "low_latency" (four per chunk, over
+            overlapping windows). Defaults to "standard".
+        adaptive_threshhold (bool, optional): Whether the threshhold should
+            follow the ambient noise. laughter_threshhold is used until the
+            noise has been estimated. Defaults to False.
+        noise_k (float, optional): Number of standard deviations above the
+            mean noise volume at which to set an adaptive threshhold.
+            Defaults to 3.0.
+        noise_halflife (float, optional): Time, in seconds, over which the
+            weight of past noise in an adaptive threshhold halves.
+            Defaults to 30.0.
+        noise_hit_weight (float, optional): Weight in the noise estimate of
+            volumes at or above the adaptive threshhold. Set to 0 to leave
+            them out. Defaults to 0.0.
+        channel (Optional[ChannelWriter], optional): Shared memory channel
+            on which to send the classification and features of every hop.
+            If None, only events are sent, over the pipe. Defaults to None.
     """
     global running
     width = 2
-    rate = 16000
+    rate = sample_rate
     channels = 1
     logger.debug(f"Starting: {locals()}")
     # Setup audio things
-    chunk_size = int(rate/(1/chunk_duration))
-    recent_volumes: FloatDeque = deque(maxlen=records)
-    audio = pyaudio.PyAudio()
-    stream = audio.open(rate=rate,
-                        channels=channels,
-                        format=pyaudio.get_format_from_width(width),
-                        input=True, output=True,
-                        input_device_index=microphone_index,
-                        frames_per_buffer=chunk_size, start=False)
-
-    # Setup matplotlib things.
-    plt.ioff()
-    fig, ax = plt.subplots()
-    ax.axhspan(
-        -laughter_threshhold, laughter_threshhold, fill=False,
-        linestyle='dotted', label="Threshhold")
-    ax.plot(np.arange(chunk_size), np.zeros(chunk_size), label="Waveform")
-    ax.set_xlim(0, chunk_size-1)
-    ax.set_ylim(-(2**(8*width))/2, (2**(8*width))/2)
-    ax.set_title("Raw Audio Signal")
-    plt.tight_layout()
-    fig.canvas.mpl_connect('close_event', figure_close)
-    plt.show(block=False)
+    recording = None
+    if source:
+        try:
+            recordings, rate = read_wave_source(source)
+        except MicrophoneError as e:
+            logger.error(e)
+            pipe.send(ErrorEnum.MICROPHONE_ERROR)
+            exit()
+        recording = np.concatenate([samples for _, samples in recordings])
+    try:
+        settings = analysis_settings(rate, chunk_duration, hop_duration,
+                                     profile, records, hits)
+        counter = HitCounter(settings.records, laughter_threshhold,
+                             min_hits=settings.hits, duty_cycle=duty_cycle)
+        rhythm = make_detector(detector, rate, rhythm_threshhold)
+    except ValueError as e:
+        logger.error(e)
+        pipe.send(ErrorEnum.CONFIG_ERROR)
+        exit()
+    timer = Instrumentation(enabled=stats_interval > 0)
+    chunk_size = settings.hop
+    windows = OverlappingWindows(settings.window, settings.hop)
+    noise = (NoiseFloor(laughter_threshhold, k=noise_k,
+                        halflife=noise_halflife, interval=chunk_size / rate,
+                        hit_weight=noise_hit_weight)
+             if adaptive_threshhold else None)
+    capture = AudioCapture(rate, chunk_size,
+                           capacity=int(rate * buffer_duration),
+                           passthrough=passthrough and recording is None)
+    audio = None
+    stream: Union[pyaudio.Stream, WaveStream]
+    if recording is not None:
+        stream = WaveStream(recording, rate, chunk_size, capture.write,
+                            on_end=capture.end)
+    else:
+        audio = pyaudio.PyAudio()
+        stream = audio.open(rate=rate,
+                            channels=channels,
+                            format=pyaudio.get_format_from_width(width),
+                            input=True, output=passthrough,
+                            input_device_index=microphone_index,
+                            frames_per_buffer=chunk_size, start=False,
+                            stream_callback=capture.callback)
+
+    # Show the waveform, unless running headless.
+    plot = None
+    if not headless:
+        plot = WaveformPlot(chunk_size, laughter_threshhold, width,
+                            fps=plot_fps, on_close=figure_close, timer=timer)
 
     # Start things going.
     stream.start_stream()
+    pipe.send(CommandEnum.READY)
     running = True
+    detection_kwargs = {
+        "pipe": pipe, "stream": stream, "capture": capture,
+        "windows": windows, "counter": counter, "rhythm": rhythm,
+        "noise": noise, "heartbeat": heartbeat,
+        "stats_interval": stats_interval, "timer": timer,
+        "channel": channel,
+        "display": plot.publish if plot is not None else None
+    }
+    if plot is None:
+        detection_loop(**detection_kwargs)
+    else:
+        # Matplotlib must stay on the main thread, so detection is moved to
+        # a thread of its own, leaving this one to run the plot.
+        detection_thread = threading.Thread(target=detection_loop,
+                                            name="DetectionThread",
+                                            kwargs=detection_kwargs,
+                                            daemon=True)
+        detection_thread.start()
+        while running and detection_thread.is_alive():
+            plot.update()
+        # If the window was closed while paused, the thread is left waiting
+        # for the parent, and ends with the process.
+        detection_thread.join(1)
+
+    # Clean up after ourselves.
+    if plot is not None:
+        plot.close()
+    stream.stop_stream()
+    stream.close()
+    if audio is not None:
+        audio.terminate()
+    if channel is not None:
+        channel.close()
+
+
+def detection_loop(pipe: Connection,
+                   stream: Union[pyaudio.Stream, WaveStream],
+                   capture: AudioCapture,
+                   windows: OverlappingWindows,
+                   counter: HitCounter,
+                   rhythm: Optional["SpectralDetector"],
+                   noise: Optional[NoiseFloor],
+                   heartbeat: float,
+                   stats_interval: float,
+                   timer: Instrumentation,
+                   display: Optional[Callable[[np.ndarray, float, float],
+                                              None]],
+                   channel: Optional[ChannelWriter] = None
+                   ) -> None:
+    """Detect laughter until told to stop or the plot window is closed.
+
+    Args:
+        pipe (Connection): Pipe for communication with the parent process.
+        stream (Union[pyaudio.Stream, WaveStream]): The (started) audio
+            stream feeding the capture buffer.
+        capture (AudioCapture): Ring buffer from which to take the audio.
+        windows (OverlappingWindows): Analysis windows over the audio.
+        counter (HitCounter): Hit counter over the recent volumes.
+        rhythm (Optional[SpectralDetector]): Spectral detector, if laughter
+            must also have the rhythm of laughter.
+        noise (Optional[NoiseFloor]): Noise floor estimate, if the
+            threshhold is to follow the ambient noise.
+        heartbeat (float): Interval, in seconds, at which to re-send an
+            unchanged classification.
+        stats_interval (float): Interval, in seconds, at which to report
+            timing statistics.
+        timer (Instrumentation): Instrumentation with which to time each
+            stage.
+        display (Optional[Callable[[ndarray, float, float], None]]): Function
+            to which to hand the newest chunk, its volume and the current
+            threshhold for display, if any.
+        channel (Optional[ChannelWriter], optional): Shared memory channel
+            on which to send every hop. Defaults to None.
+    """
+    policy = EmissionPolicy(heartbeat)
+    next_report = time.monotonic() + stats_interval
     while running:
         if pipe.poll(0):
             payload = pipe.recv()
             if payload == CommandEnum.TERMINATE:
                 break
+            elif payload == CommandEnum.PAUSE:
+                stream.stop_stream()
+                if not wait_for_resume(pipe):
+                    break
+                capture.clear()
+                stream.start_stream()
+                windows.clear()
+                counter.clear()
+                if rhythm is not None:
+                    rhythm.clear()
+                policy = EmissionPolicy(heartbeat)
+                pipe.send(CommandEnum.READY)
 
-        stat = detect_laughter(
-            stream=stream, chunk_size=chunk_size, sample_width=width,
-            figure=fig, hit_volume=laughter_threshhold, num_hits=hits,
-            recent_volumes=recent_volumes)
-        # Refresh the plot.
-        fig.canvas.draw_idle()
-        fig.canvas.flush_events()
+        # Analyse everything that has arrived since the last pass.
         try:
-            pipe.send(stat)
+            samples, stats = detect_laughter(capture=capture,
+                                             windows=windows,
+                                             counter=counter, rhythm=rhythm,
+                                             noise=noise, timer=timer)
+            for stat in stats:
+                emit = policy.should_send(stat.event)
+                if channel is not None:
+                    channel.send(stat.event, stat.timestamp, emit,
+                                 **stat.features)
+                elif emit:
+                    pipe.send(stat._replace(features=None))
+            timer.mark("send")
+        except MicrophoneError as e:
+            logger.error(e.args)
+            pipe.send(ErrorEnum.MICROPHONE_ERROR)
+            break
+        except EOFError:
+            logger.info("The recording has ended.")
+            pipe.send(CommandEnum.TERMINATE)
+            break
         except BrokenPipeError as e:
             logger.exception(e)
             break
 
+        if display is not None:
+            display(samples, counter.last, counter.hit_volume)
+
+        now = time.monotonic()
+        if timer.enabled and now >= next_report:
+            timer.gauge("events_sent", policy.sent)
+            timer.gauge("events_suppressed", policy.suppressed)
+            timer.gauge("overflows", capture.overflows)
+            timer.gauge("underruns", capture.underruns)
+            timer.gauge("backlog", capture.backlog)
+            if rhythm is not None:
+                timer.gauge("rhythm", rhythm.ratio)
+            timer.gauge("threshhold", counter.hit_volume)
+            if noise is not None:
+                timer.gauge("noise_mean", noise.mean)
+                timer.gauge("noise_stddev", noise.stddev)
+            summary = timer.summary()
+            logger.info("Timings: %s", format_summary(summary))
+            pipe.send(StatsReport(mp.current_process().name, summary))
+            next_report = now + stats_interval
+
     if not running:
+        # The plot window was closed.
         pipe.send(CommandEnum.TERMINATE)
 
-    # Clean up after ourselves.
-    plt.close('all')
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
 
+class SpectralDetector:
+    """Laughter detection from the rhythm of the voice band.
+
+    The energy in the voice band is measured over short overlapping frames,
+    giving an envelope sampled at rate / hop. Laughter is a train of
+    syllables at roughly 4-6 per second, so over the last `window` seconds,
+    much of the envelope's modulation is at those frequencies. Speech is
+    less regular, and claps and bangs are isolated transients.
+
+    Attributes:
+        ratio (float): Share of the recent modulation that is at the syllable
+            rate of laughter. 0 until a whole window has been analysed.
+        min_ratio (float): Share above which sound is considered laughter.
+    """
+
+    frame_size = 512
+    hop = 256
+    voice_band = (300.0, 3000.0)
+    rhythm_band = (4.0, 6.0)
+    modulation_band = (1.0, 16.0)
+
+    def __init__(self,
+                 rate: int,
+                 min_ratio: float = 0.4,
+                 window: float = 1.0) -> None:
+        """Initialise the object.
+
+        Args:
+            rate (int): Sample rate of the audio, in Hz.
+            min_ratio (float, optional): Share of the modulation that must be
+                at the syllable rate of laughter. Defaults to 0.4.
+            window (float, optional): Duration, in seconds, of the envelope
+                to analyse. Defaults to 1.0.
+        """
+        self.rate = rate
+        self.min_ratio = min_ratio
+        self._envelope_rate = rate / self.hop
+        self._length = round(window * self._envelope_rate)
+        self.clear()
+
+    def add(self, samples: np.ndarray) -> bool:
+        """Analyse the next chunk of audio.
+
+        Returns:
+            bool: Whether the recent audio has the rhythm of laughter.
+        """
+        pending = np.concatenate((self._pending, samples))
+        energies = band_energies(pending, self.rate, self.frame_size,
+                                 self.hop, self.voice_band)
+        self._pending = pending[len(energies) * self.hop:]
+        self._envelope = np.concatenate(
+            (self._envelope, np.log10(energies + 1.0)))[-self._length:]
+        if len(self._envelope) == self._length:
+            self.ratio = modulation_ratio(
+                self._envelope, self._envelope_rate, self.rhythm_band,
+                self.modulation_band)
+        return self.ratio >= self.min_ratio
+
+    def clear(self) -> None:
+        """Forget all audio analysed so far."""
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._envelope = np.zeros(0)
+        self.ratio = 0.0
 
-def detect_laughter(stream: pyaudio.Stream,
-                    chunk_size: int,
-                    sample_width: int,
-                    figure: Figure,
-                    hit_volume: float,
-                    num_hits: int,
-                    recent_volumes: FloatDeque) -> EventEnum:
-    """Detect laughter, draw graph, and return.
+
+def detect_laughter(
+        capture: AudioCapture,
+        windows: OverlappingWindows,
+        counter: HitCounter,
+        rhythm: Optional[SpectralDetector] = None,
+        noise: Optional[NoiseFloor] = None,
+        timer: Instrumentation = NO_INSTRUMENTATION
+) -> tuple[np.ndarray, list[TimedEvent]]:
+    """Detect laughter in all of the audio waiting to be analysed.
+
+    Waits for at least one hop of audio, then analyses every hop that is
+    available at once, classifying the sound after each.
 
     Args:
-        stream (pyaudio.Stream): Audio stream from which to sample.
-        chunk_size (int): Chunk size of buffer.
-        sample_width (int): Sample width (16-bit etc).
-        figure (Figure): Figure to which to plot the waveform.
-        hit_volume (float): Minimum volume for a hit.
-        num_hits (int): Number of hits required to trigger laughter detection.
-        recent_volumes (FloatDeque): Deque of recently recorded volumes.
+        capture (AudioCapture): Ring buffer from which to take the audio, one
+            hop at a time.
+        windows (OverlappingWindows): Analysis windows over the audio.
+        counter (HitCounter): Hit counter over the recent volumes.
+        rhythm (Optional[SpectralDetector], optional): Spectral detector, if
+            laughter must also have the rhythm of laughter. Defaults to None.
+        noise (Optional[NoiseFloor], optional): Noise floor estimate, which
+            sets the counter's threshhold after each volume. Defaults to None.
+        timer (Instrumentation, optional): Instrumentation with which to time
+            each stage. Defaults to NO_INSTRUMENTATION.
+
+    Raises:
+        MicrophoneError: If no audio arrived in time.
+        EOFError: If the recording being played has ended.
 
     Returns:
-        EventEnum: EventEnum according to whether laughter has been detected or
-            not.
+        tuple[ndarray, list[TimedEvent]]: The samples of the newest hop, and
+            for each hop, EventEnum according to whether laughter has been
+            detected or not with the time at which the hop was captured and
+            its features (volume, threshhold and rhythm).
     """
-    in_data = stream.read(chunk_size)
-    volume = audioop.rms(in_data, sample_width)
-    recent_volumes.append(volume)
-    stream.write(in_data)
-    do_show(in_data, volume, figure)
-    return classify_sound(recent_volumes, hit_volume, num_hits)
+    timer.start()
+    chunk_size = capture.chunk_size
+    count = max(capture.available(), 1)
+    samples, captured_at = capture.read(count)
+    timer.mark("read")
+    volumes = windows.rms(samples)
+    chunks = as_chunks(samples, chunk_size)
+    stats = []
+    for i, volume in enumerate(volumes):
+        features = {"volume": float(volume), "threshhold": counter.hit_volume}
+        if rhythm is None:
+            stat = classify_sound(counter, float(volume))
+        else:
+            stat = classify_rhythm(counter, rhythm, float(volume), chunks[i])
+            features["rhythm"] = rhythm.ratio
+        if noise is not None:
+            counter.hit_volume = noise.update(float(volume))
+        age = (count - 1 - i) * chunk_size / capture.rate
+        stats.append(TimedEvent(stat, captured_at - age, features))
+    timer.mark("analysis")
+    return samples[-chunk_size:], stats
 
 
-def classify_sound(volumes: FloatDeque,
-                   hit_volume: float,
-                   min_hits: int) -> EventEnum:
-    """Classify recent volume samples.
+def classify_sound(counter: HitCounter, volume: float) -> EventEnum:
+    """Classify the latest volume sample, in light of recent samples.
 
     Args:
-        volumes (FloatDeque): Deque of recently recorded volumes.
-        hit_volume (float): Minimum volume in order for a hit to be recorded.
-        min_hits (int): Minimum number of hits required for laughter detection.
+        counter (HitCounter): Hit counter over the recent volumes.
+        volume (float): Volume of the latest audio chunk.
 
     Returns:
         EventEnum: EventEnum.LAUGHTER_DETECTED or
             EventEnum.NO_LAUGHTER_DETECTED depending on whether laughter is
             detected or not.
     """
-    # Only allow laughter detection when a full number of segments has been
+    # Laughter is only detected once a full window of records has been
     # collected.
-    if volumes.maxlen is not None and len(volumes) < volumes.maxlen:
-        return EventEnum.NO_LAUGHTER_DETECTED
-    hits = [volume >= hit_volume for volume in volumes].count(True)
-    if hits >= min_hits:
+    if counter.add(volume):
         return EventEnum.LAUGHTER_DETECTED
     return EventEnum.NO_LAUGHTER_DETECTED
 
 
-def do_show(frame: bytes, rms: float, figure: Figure) -> None:
-    """Visually display the waveform from the microphone feed.
+def make_detector(name: str,
+                  rate: int,
+                  rhythm_threshhold: float) -> Optional[SpectralDetector]:
+    """Construct the laughter detector with the given name.
 
     Args:
-        frame (bytes): Latest audio frame ('segment') collected.
-        rms (float): Volume (RMS) of this frame.n]
-        figure (Figure): Figure on which to plot the waveform.
+        name (str): Name of the detector, either "rms" or "spectral".
+        rate (int): Sample rate of the audio, in Hz.
+        rhythm_threshhold (float): Minimum share of the modulation at the
+            syllable rate of laughter, for the spectral detector.
+
+    Raises:
+        ValueError: If the detector name is unknown.
+
+    Returns:
+        Optional[SpectralDetector]: The spectral detector, or None if
+            loudness alone is to be used.
     """
-    amplitudes = np.fromstring(frame, np.int16)
-    ax = figure.gca()
-    for child in ax.get_children():
-        label = child.get_label()
-        # Delete the volume polygon.
-        if label == "Volume":
-            child.remove()
-        # Replace the data in the waveform.
-        elif label == "Waveform":
-            child.set_ydata(amplitudes)
-    # Add a new volume polygon.
-    ax.axhspan(-rms, rms, fill=False, label="Volume")
+    name = name.strip().casefold()
+    if name == "rms":
+        return None
+    elif name == "spectral":
+        return SpectralDetector(rate, min_ratio=rhythm_threshhold)
+    raise ValueError(f'Unknown laughter detector "{name}".')
+
+
+def classify_rhythm(counter: HitCounter,
+                    rhythm: SpectralDetector,
+                    volume: float,
+                    samples: np.ndarray) -> EventEnum:
+    """Classify the latest chunk by its loudness and rhythm.
+
+    Args:
+        counter (HitCounter): Hit counter over the recent volumes.
+        rhythm (SpectralDetector): Spectral detector.
+        volume (float): Volume of the latest audio chunk.
+        samples (ndarray): Samples of the latest audio chunk.
+
+    Returns:
+        EventEnum: EventEnum.LAUGHTER_DETECTED if the recent audio is both
+            loud enough and has the rhythm of laughter, otherwise
+            EventEnum.NO_LAUGHTER_DETECTED.
+    """
+    loud = counter.add(volume)
+    if rhythm.add(samples) and loud:
+        return EventEnum.LAUGHTER_DETECTED
+    return EventEnum.NO_LAUGHTER_DETECTED
 
 
 def figure_close(event: CloseEvent) -> None:
@@ -0,0 +1,112 @@
+"""Player selection for the expression detection component.
+
+When more than one face is in view (a spectator leaning in, say), only one of
+them belongs to the player. All of the faces in a frame are classified in one
+batch by the backend, and a `PlayerSelector` then picks out the player's by
+one of the following policies:
+
+    first: Whichever face the backend happens to list first.
+    largest: The face with the largest box, which is usually the closest.
+    centre: The face closest to the centre of the frame.
+    sticky: The face that best overlaps the player's face in the previous
+        frame, so that control only changes hands if the player is lost (at
+        which point the largest face is taken).
+"""
+
+from typing import Optional, Sequence
+
+from .types import FERList
+
+PLAYER_POLICIES = ("first", "largest", "centre", "sticky")
+
+
+def overlap(a: Sequence[int], b: Sequence[int]) -> float:
+    """Compute the intersection over union of two boxes.
+
+    Args:
+        a (Sequence[int]): A box, as [x, y, width, height].
+        b (Sequence[int]): Another box.
+
+    Returns:
+        float: Area of the intersection of the boxes over the area of their
+            union, between 0 and 1.
+    """
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    width = min(ax + aw, bx + bw) - max(ax, bx)
+    height = min(ay + ah, by + bh) - max(ay, by)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+class PlayerSelector:
+    """Picks the player's face out of all those found in a frame.
+
+    Attributes:
+        policy (str): The selection policy (one of PLAYER_POLICIES).
+        box (Optional[list[int]]): Box of the most recently selected face, or
+            None if none has been selected yet.
+    """
+
+    def __init__(self,
+                 policy: str = "first",
+                 min_overlap: float = 0.3) -> None:
+        """Initialise the object.
+
+        Args:
+            policy (str, optional): The selection policy. Defaults to "first".
+            min_overlap (float, optional): Minimum intersection over union
+                with the previous box for the sticky policy to consider a
+                face the same player's. Defaults to 0.3.
+
+        Raises:
+            ValueError: If the policy is unknown.
+        """
+        policy = policy.strip().casefold()
+        if policy not in PLAYER_POLICIES:
+            raise ValueError(f'Unknown player policy "{policy}".')
+        self.policy = policy
+        self.min_overlap = min_overlap
+        self.box: Optional[list[int]] = None
+
+    def select(self, emotions: FERList, shape: Sequence[int]) -> FERList:
+        """Move the player's face to the front of the list.
+
+        Args:
+            emotions (FERList): Boxes and emotions of the faces in a frame.
+            shape (Sequence[int]): Shape of the frame.
+
+        Returns:
+            FERList: The same faces, with the player's first.
+        """
+        if not emotions:
+            # Remember the player, in case they're only briefly hidden.
+            return emotions
+        index = self._choose(emotions, shape)
+        self.box = list(emotions[index]['box'])
+        if index == 0:
+            return emotions
+        return [emotions[index], *emotions[:index], *emotions[index+1:]]
+
+    def clear(self) -> None:
+        """Forget the player."""
+        self.box = None
+
+    def _choose(self, emotions: FERList, shape: Sequence[int]) -> int:
+        """Get the index of the player's face."""
+        boxes = [face['box'] for face in emotions]
+        if self.policy == "first" or len(boxes) == 1:
+            return 0
+        if self.policy == "centre":
+            cx, cy = shape[1] / 2, shape[0] / 2
+            distances = [(x + w / 2 - cx)**2 + (y + h / 2 - cy)**2
+                         for x, y, w, h in boxes]
+            return min(range(len(boxes)), key=distances.__getitem__)
+        if self.policy == "sticky" and self.box is not None:
+            overlaps = [overlap(self.box, box) for box in boxes]
+            best = max(range(len(boxes)), key=overlaps.__getitem__)
+            if overlaps[best] >= self.min_overlap:
+                return best
+        return max(range(len(boxes)), key=lambda i: boxes[i][2] * boxes[i][3])
@@ -0,0 +1,175 @@
+"""Detection process pool.
+
+Starting the detection processes (and loading the expression model in
+particular) takes several seconds, so rather than starting them afresh for
+every game, a `WorkerPool` can keep them alive across consecutive games. At
+the end of a game, pooled workers are paused rather than terminated, and are
+resumed by the next game, as long as their settings haven't changed.
+
+Workers take part in this by handling `CommandEnum.PAUSE` (see
+`wait_for_resume`), and by sending `CommandEnum.READY` once they are set up
+and whenever they resume. Anything a worker sent before it was paused that
+is still waiting to be received is discarded when it resumes, so that a
+stale event or READY from the last game isn't acted on in the next.
+
+A worker can also be given a shared memory channel (see `wysl.channel`) on
+which to send its results, in which case the pool owns the channel and
+releases it when the worker is stopped.
+"""
+
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .channel import ChannelConnection, RingChannel
+from .enums import CommandEnum
+
+logger = mp.get_logger()
+
+
+class Worker(NamedTuple):
+    """A pooled process, our end of its pipe, and its arguments.
+
+    If the worker sends its results over a shared memory channel, the pipe is
+    the reading end of the channel.
+    """
+
+    process: mp.Process
+    pipe: Union[Connection, ChannelConnection]
+    kwargs: dict[str, Any]
+    channel: Optional[RingChannel] = None
+
+
+class WorkerPool:
+    """Detection processes that can be kept alive between games."""
+
+    def __init__(self) -> None:
+        """Initialise the object."""
+        self._workers: dict[str, Worker] = {}
+
+    def start(self,
+              name: str,
+              target: Callable[..., None],
+              kwargs: dict[str, Any],
+              record: Optional[np.dtype] = None
+              ) -> Union[Connection, ChannelConnection]:
+        """Start a worker, or resume it if it's already running.
+
+        A paused worker is only reused if it was started with the same
+        arguments and record type; otherwise, it is terminated and a new one
+        started.
+
+        Args:
+            name (str): Name of the worker process.
+            target (Callable[..., None]): Worker loop. It will be passed its
+                end of the pipe as the keyword argument "pipe", and the
+                writing end of its channel (if any) as "channel".
+            kwargs (dict[str, Any]): Other keyword arguments for the target.
+            record (Optional[np.dtype], optional): Type of the records the
+                worker sends over a shared memory channel. If None, results
+                are sent over the pipe. Defaults to None.
+
+        Returns:
+            Union[Connection, ChannelConnection]: Our end of the pipe to the
+                worker, or the reading end of its channel.
+        """
+        worker = self._workers.get(name)
+        if worker is not None:
+            if (worker.process.is_alive() and worker.kwargs == kwargs
+                    and (worker.channel.dtype if worker.channel is not None
+                         else None) == record):
+                logger.info("Resuming %s", name)
+                # Before START, so the READY that answers it is kept.
+                self._drain(name, worker)
+                worker.pipe.send(CommandEnum.START)
+                return worker.pipe
+            self.stop(name)
+
+        local, remote = mp.Pipe()
+        channel = None
+        process_kwargs = {"pipe": remote, **kwargs}
+        pipe: Union[Connection, ChannelConnection] = local
+        if record is not None:
+            channel = RingChannel(record)
+            process_kwargs["channel"] = channel.writer(remote)
+            pipe = channel.connection(local)
+        process = mp.Process(name=name, target=target, kwargs=process_kwargs)
+        process.start()
+        process.join(0)
+        self._workers[name] = Worker(process, pipe, dict(kwargs), channel)
+        return pipe
+
+    def pause(self) -> None:
+        """Pause all workers until they are next started."""
+        for name in list(self._workers):
+            try:
+                self._workers[name].pipe.send(CommandEnum.PAUSE)
+            except (OSError, BrokenPipeError):
+                self.stop(name)
+
+    def stop(self, name: str) -> None:
+        """Terminate a worker."""
+        worker = self._workers.pop(name)
+        try:
+            worker.pipe.send(CommandEnum.TERMINATE)
+        except (OSError, BrokenPipeError):
+            pass
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.pipe.close()
+        if worker.channel is not None:
+            if worker.channel.dropped:
+                logger.warning("%s dropped %d records", name,
+                               worker.channel.dropped)
+            worker.channel.close()
+
+    def close(self) -> None:
+        """Terminate all workers."""
+        for name in list(self._workers):
+            self.stop(name)
+
+    def _drain(self, name: str, worker: Worker) -> None:
+        """Discard everything a paused worker sent that hasn't been read."""
+        if isinstance(worker.pipe, ChannelConnection):
+            count = worker.pipe.clear()
+        else:
+            count = 0
+            while worker.pipe.poll(0):
+                worker.pipe.recv()
+                count += 1
+        if count:
+            logger.info("Discarded %d stale messages from %s", count, name)
+
+
+def wait_for_resume(pipe: Connection,
+                    idle: Optional[Callable[[], Any]] = None,
+                    interval: float = 0.1) -> bool:
+    """Block a paused worker until it is told to resume or terminate.
+
+    Args:
+        pipe (Connection): The worker's end of its pipe.
+        idle (Optional[Callable[[], Any]], optional): Function to call every
+            interval while waiting, e.g. to keep a GUI responsive.
+            Defaults to None.
+        interval (float, optional): How often, in seconds, to call idle.
+            Defaults to 0.1.
+
+    Returns:
+        bool: True if the worker should resume, False if it should terminate.
+    """
+    while True:
+        try:
+            if not pipe.poll(interval if idle is not None else None):
+                if idle is not None:
+                    idle()
+                continue
+            payload = pipe.recv()
+        except (EOFError, OSError):
+            return False
+        if payload == CommandEnum.START:
+            return True
+        elif payload == CommandEnum.TERMINATE:
+            return False
@@ -0,0 +1,339 @@
+"""Offline replay benchmarks.
+
+These run recorded sessions through the detection pipelines as fast as
+possible, so that detector settings can be compared on the same input without
+a webcam and without real-time pacing. Each replay returns a human-readable
+report of the throughput, the latency of each stage of the pipeline and the
+sequence of events the pipeline would have sent.
+
+Laughter replays can also be scored against hand-made labels of when the
+players were laughing, in the label format exported by Audacity: one
+interval per line, as start and end times in seconds followed by an optional
+label, separated by whitespace.
+"""
+
+import time
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Mapping, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .analysis import OverlappingWindows, as_chunks
+from .audio import read_wave_source
+from .backends import make_backend
+from .capture import open_video_source
+from .emission import EmissionPolicy
+from .enums import EventEnum
+from .exceptions import CameraError, ConfigError, MicrophoneError, ModelError
+from .expression import SmoothedClassifier, detect_emotions
+from .hits import HitCounter, NoiseFloor
+from .laughter import (analysis_settings, classify_rhythm, classify_sound,
+                       make_detector)
+from .players import PlayerSelector
+from .tracking import FaceTracker
+
+PERCENTILES = (50, 90, 99)
+
+Interval = tuple[float, float]
+
+
+def replay_expression(config: ConfigParser, source: str = "") -> str:
+    """Replay a recorded video through the expression pipeline.
+
+    Args:
+        config (ConfigParser): Game configuration. Detector settings are taken
+            from its expression section.
+        source (str, optional): Path to a video file or directory of images.
+            If empty, the configured source is used. Defaults to "".
+
+    Raises:
+        CameraError: If there is no source or it cannot be opened.
+        ModelError: If the expression backend cannot be set up.
+        ConfigError: If the smoothing method or player policy is unknown.
+
+    Returns:
+        str: The report.
+    """
+    cfg = config["expression"]
+    source = source or cfg.get("source")
+    if not source:
+        raise CameraError("No video source given.")
+    cap = open_video_source(0, source)
+    if not cap.isOpened():
+        raise CameraError(f'Failed to open {source}.')
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    try:
+        classifier = SmoothedClassifier(
+            happy_weight=cfg.getfloat("happy_weight"),
+            surprise_weight=cfg.getfloat("surprise_weight"),
+            low_threshhold=cfg.getfloat("low_threshhold"),
+            medium_threshhold=cfg.getfloat("medium_threshhold"),
+            high_threshhold=cfg.getfloat("high_threshhold"),
+            smoothing=cfg.get("smoothing"),
+            window=cfg.getint("smoothing_window"),
+            alpha=cfg.getfloat("smoothing_alpha"),
+            hysteresis=cfg.getfloat("hysteresis"))
+        selector = PlayerSelector(cfg.get("player_policy"))
+    except ValueError as e:
+        cap.release()
+        raise ConfigError(*e.args) from e
+    try:
+        detector = make_backend(cfg.get("backend"),
+                                mtcnn=cfg.getboolean("mtcnn"),
+                                model_path=cfg.get("model_path"))
+    except (ValueError, cv2.error) as e:
+        cap.release()
+        raise ModelError(*e.args) from e
+    tracker = (FaceTracker(cfg.getint("redetect_interval"),
+                           cfg.getfloat("tracking_confidence"))
+               if cfg.getboolean("tracking") else None)
+
+    inference_width = cfg.getint("inference_width")
+    # Only transitions are of interest here, not heartbeats.
+    policy = EmissionPolicy(0.0)
+    stages: dict[str, list[float]] = {
+        "capture": [], "inference": [], "classification": []}
+    events: list[tuple[float, EventEnum]] = []
+    frames = 0
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        stat, frame = cap.read()
+        if not stat:
+            break
+        t1 = time.perf_counter()
+        frame = cv2.flip(frame, 1)
+        emotions = detect_emotions(frame, detector, tracker, inference_width,
+                                   selector)
+        t2 = time.perf_counter()
+        event = (classifier(emotions[0]['emotions']) if len(emotions) > 0
+                 else EventEnum.NO_SMILE_DETECTED)
+        t3 = time.perf_counter()
+
+        stages["capture"].append(t1 - t0)
+        stages["inference"].append(t2 - t1)
+        stages["classification"].append(t3 - t2)
+        if policy.should_send(event):
+            events.append((frames / fps, event))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    lines = [f'Source: {source}',
+             f'Frames: {frames} in {elapsed:.2f}s '
+             f'({frames / elapsed if elapsed else 0:.1f} fps)',
+             *format_latencies(stages),
+             f'Events ({len(events)}):']
+    lines.extend(f'  {format_timestamp(t)}  {event.value.decode()}'
+                 for t, event in events)
+    return "\n".join(lines)
+
+
+def replay_laughter(config: ConfigParser,
+                    source: str = "",
+                    labels: str = "") -> str:
+    """Replay recorded audio through the laughter pipeline.
+
+    If the recording is labelled, each hop's classification is scored
+    against the labels. A hop counts as laughter if its midpoint lies in a
+    labelled interval.
+
+    Args:
+        config (ConfigParser): Game configuration. Detector settings are taken
+            from its laughter section.
+        source (str, optional): Path to a WAV file or directory of WAV files.
+            If empty, the configured source is used. Defaults to "".
+        labels (str, optional): Path to the label file, with times relative
+            to the start of the first file. If empty, each WAV file's labels
+            are looked for alongside it, in a text file of the same name.
+            Defaults to "".
+
+    Raises:
+        MicrophoneError: If there is no source, or it cannot be read.
+        ConfigError: If the detector settings are invalid.
+
+    Returns:
+        str: The report.
+    """
+    cfg = config["laughter"]
+    source = source or cfg.get("source")
+    if not source:
+        raise MicrophoneError("No audio source given.")
+    recordings, rate = read_wave_source(source)
+    try:
+        settings = analysis_settings(rate, cfg.getfloat("chunk_duration"),
+                                     cfg.getfloat("hop_duration"),
+                                     cfg.get("profile"), cfg.getint("records"),
+                                     cfg.getint("hits"))
+        counter = HitCounter(settings.records, cfg.getfloat("threshhold"),
+                             min_hits=settings.hits,
+                             duty_cycle=cfg.getfloat("duty_cycle"))
+        rhythm = make_detector(cfg.get("detector"), rate,
+                               cfg.getfloat("rhythm_threshhold"))
+    except ValueError as e:
+        raise ConfigError(*e.args) from e
+
+    # Lay the recordings end to end, along with their labels.
+    intervals: list[Interval] = []
+    labelled = bool(labels)
+    if labels:
+        intervals = load_labels(Path(labels))
+    offset = 0.0
+    for path, samples in recordings:
+        label_path = path.with_suffix(".txt")
+        if not labels and label_path.is_file():
+            intervals.extend((start + offset, end + offset)
+                             for start, end in load_labels(label_path))
+            labelled = True
+        offset += len(samples) / rate
+    audio = np.concatenate([samples for _, samples in recordings])
+
+    chunk_size = settings.hop
+    windows = OverlappingWindows(settings.window, settings.hop)
+    noise = (NoiseFloor(cfg.getfloat("threshhold"),
+                        k=cfg.getfloat("noise_k"),
+                        halflife=cfg.getfloat("noise_halflife"),
+                        interval=chunk_size / rate,
+                        hit_weight=cfg.getfloat("noise_hit_weight"))
+             if cfg.getboolean("adaptive_threshhold") else None)
+    policy = EmissionPolicy(0.0)
+    stages: dict[str, list[float]] = {"analysis": [], "classification": []}
+    events: list[tuple[float, EventEnum]] = []
+    detections: list[bool] = []
+    start = time.perf_counter()
+    for i, chunk in enumerate(as_chunks(audio, chunk_size)):
+        t0 = time.perf_counter()
+        volume = float(windows.rms(chunk)[0])
+        t1 = time.perf_counter()
+        if rhythm is None:
+            event = classify_sound(counter, volume)
+        else:
+            event = classify_rhythm(counter, rhythm, volume, chunk)
+        if noise is not None:
+            counter.hit_volume = noise.update(volume)
+        t2 = time.perf_counter()
+
+        stages["analysis"].append(t1 - t0)
+        stages["classification"].append(t2 - t1)
+        detections.append(event is EventEnum.LAUGHTER_DETECTED)
+        if policy.should_send(event):
+            events.append(((i + 1) * chunk_size / rate, event))
+    elapsed = time.perf_counter() - start
+
+    duration = len(audio) / rate
+    lines = [f'Source: {source}',
+             f'Audio: {duration:.1f}s in {len(detections)} hops, analysed '
+             f'in {elapsed:.2f}s '
+             f'({duration / elapsed if elapsed else 0:.0f}x real time)',
+             *format_latencies(stages)]
+    if noise is not None:
+        lines.append(f'Adaptive threshhold: {noise.threshhold:.1f} at the end '
+                     f'(noise mean {noise.mean:.1f}, '
+                     f'stddev {noise.stddev:.1f})')
+    if labelled:
+        lines.append(score_detections(detections, chunk_size / rate,
+                                      intervals))
+    lines.append(f'Events ({len(events)}):')
+    lines.extend(f'  {format_timestamp(t)}  {event.value.decode()}'
+                 for t, event in events)
+    return "\n".join(lines)
+
+
+def load_labels(path: Path) -> list[Interval]:
+    """Read the labelled intervals from a label file.
+
+    Args:
+        path (Path): Path to the file.
+
+    Raises:
+        MicrophoneError: If the file can't be read or parsed.
+
+    Returns:
+        list[Interval]: Start and end times of each interval, in seconds.
+    """
+    intervals = []
+    try:
+        with open(path) as file:
+            for number, line in enumerate(file, 1):
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                intervals.append((float(fields[0]), float(fields[1])))
+    except OSError as e:
+        raise MicrophoneError(f'Failed to read {path}: {e}') from e
+    except (ValueError, IndexError):
+        raise MicrophoneError(f'{path}, line {number}: expected a start and '
+                              f'end time.') from None
+    return intervals
+
+
+def score_detections(detections: Sequence[bool],
+                     chunk_duration: float,
+                     intervals: Sequence[Interval]) -> str:
+    """Score per-chunk detections against labelled intervals.
+
+    Args:
+        detections (Sequence[bool]): Whether laughter was detected in each
+            chunk.
+        chunk_duration (float): Duration of each chunk, in seconds.
+        intervals (Sequence[Interval]): Labelled intervals of laughter.
+
+    Returns:
+        str: Precision, recall and F1 score, with the underlying counts.
+    """
+    midpoints = (np.arange(len(detections)) + 0.5) * chunk_duration
+    truth = np.zeros(len(detections), dtype=bool)
+    for start, end in intervals:
+        truth |= (midpoints >= start) & (midpoints < end)
+    detected = np.asarray(detections, dtype=bool)
+    tp = int(np.sum(detected & truth))
+    fp = int(np.sum(detected & ~truth))
+    fn = int(np.sum(~detected & truth))
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1 = (_ratio(2 * precision * recall, precision + recall)
+          if precision is not None and recall is not None else None)
+    return (f'Precision: {_percent(precision)}  Recall: {_percent(recall)}  '
+            f'F1: {_percent(f1)}  (chunks: {tp} TP, {fp} FP, {fn} FN)')
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    """Divide, or return None if the denominator is 0."""
+    return numerator / denominator if denominator else None
+
+
+def _percent(value: Optional[float]) -> str:
+    """Format a ratio as a percentage, or n/a if it is undefined."""
+    return "n/a" if value is None else f'{value:.1%}'
+
+
+def format_latencies(stages: Mapping[str, Sequence[float]]) -> list[str]:
+    """Tabulate latency percentiles for each stage of a pipeline.
+
+    Args:
+        stages (Mapping[str, Sequence[float]]): Latencies, in seconds, keyed by
+            stage name.
+
+    Returns:
+        list[str]: Lines of the table, with latencies in milliseconds.
+    """
+    width = max((len(name) for name in stages), default=5)
+    header = "".join(f'{f"p{p}":>9}' for p in PERCENTILES)
+    lines = [f'{"Stage".ljust(width)}{header}{"max":>9}  (ms)']
+    for name, samples in stages.items():
+        if len(samples) == 0:
+            continue
+        values = np.percentile(np.asarray(samples) * 1000, PERCENTILES)
+        lines.append(f'{name.ljust(width)}'
+                     + "".join(f'{v:9.2f}' for v in values)
+                     + f'{max(samples) * 1000:9.2f}')
+    return lines
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format a position in a recording as mm:ss.fff."""
+    minutes, seconds = divmod(seconds, 60)
+    return f'{int(minutes):02d}:{seconds:06.3f}'
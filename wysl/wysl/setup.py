@@ -1,18 +1,18 @@
 """Setup component of the game."""
 
-import audioop
 import cmd
 import socket
-import statistics
 from collections import namedtuple
 from configparser import ConfigParser
 from typing import Any, Optional
 
 import cv2
+import numpy as np
 import pyaudio
 import serial
 from serial.tools.list_ports import comports
 
+from .analysis import as_samples, chunk_features
 from .utils import elicit_float, elicit_ipv4_address
 
 Camera = namedtuple('Camera', ('port', 'width', 'height', 'frame_rate'))
@@ -323,7 +323,7 @@ def measure_noise(microphone_index: int,
     rate = 16000
     record_seconds = 7
 
-    volumes = []
+    data = []
     p = pyaudio.PyAudio()
     stream = p.open(format=pyaudio.get_format_from_width(width),
                     channels=channels, rate=rate, input=True,
@@ -336,8 +336,7 @@ def measure_noise(microphone_index: int,
 
     ser.write(b'!A101!B211!C309!D401')
     for _ in range(int(rate/chunk*record_seconds)):
-        data = stream.read(chunk)
-        volumes.append(audioop.rms(data, width))
+        data.append(stream.read(chunk))
     ser.write(b'!A0!B0!C0!D0-A-B-C-D')
 
     print("Done.")
@@ -347,8 +346,9 @@ def measure_noise(microphone_index: int,
     stream.close()
     p.terminate()
 
-    mean = statistics.mean(volumes[20:-20])
-    stddev = statistics.stdev(volumes[20:-20])
+    volumes = chunk_features(as_samples(b"".join(data), width), chunk).rms
+    mean = float(np.mean(volumes[20:-20]))
+    stddev = float(np.std(volumes[20:-20], ddof=1))
     print(f'Mean: {mean}; Standard deviation: {stddev}')
 
     return mean, stddev
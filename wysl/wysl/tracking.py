@@ -0,0 +1,110 @@
+"""Face tracking for the expression detection component.
+
+Finding a face in a whole frame (particularly with MTCNN) is far more expensive
+than classifying the expression on a face that has already been found. The
+`FaceTracker` follows a face found by the detector from frame to frame with
+cheap template matching, so that full detection only needs to be run every so
+often, or when the tracker loses confidence.
+"""
+
+from typing import Optional
+
+import cv2
+from numpy import ndarray
+
+
+class FaceTracker:
+    """Template-matching face tracker.
+
+    Attributes:
+        box (Optional[list[int]]): The currently tracked face box, as
+            [x, y, width, height], or None if no face is being tracked.
+        confidence (float): Normalised correlation between the tracked face
+            and the template from the most recent update, in [-1, 1].
+    """
+
+    def __init__(self,
+                 redetect_interval: int,
+                 min_confidence: float,
+                 search_margin: float = 0.5) -> None:
+        """Initialise the object.
+
+        Args:
+            redetect_interval (int): Maximum number of frames to track before
+                requiring a full detection again.
+            min_confidence (float): Minimum match confidence for the tracked
+                box to be trusted.
+            search_margin (float, optional): How far around the last box to
+                search for the face, as a fraction of the box size.
+                Defaults to 0.5.
+        """
+        self._redetect_interval = redetect_interval
+        self._min_confidence = min_confidence
+        self._search_margin = search_margin
+        self._template: Optional[ndarray] = None
+        self._frames_tracked = 0
+        self.box: Optional[list[int]] = None
+        self.confidence = 0.0
+
+    def needs_detection(self) -> bool:
+        """Whether a full face detection should be run on the next frame."""
+        return (self.box is None
+                or self._frames_tracked >= self._redetect_interval
+                or self.confidence < self._min_confidence)
+
+    def reset(self, frame: ndarray, box: Optional[list[int]]) -> None:
+        """Start tracking a newly detected face.
+
+        Args:
+            frame (ndarray): The frame in which the face was detected.
+            box (Optional[list[int]]): Box of the detected face, or None if
+                no face was found.
+        """
+        self._frames_tracked = 0
+        self.box = None
+        self._template = None
+        self.confidence = 0.0
+        if box is None:
+            return
+        x, y, w, h = (int(v) for v in box)
+        x, y = max(x, 0), max(y, 0)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        template = gray[y:y+h, x:x+w].copy()
+        if template.size == 0:
+            return
+        self._template = template
+        h, w = template.shape
+        self.box = [x, y, w, h]
+        self.confidence = 1.0
+
+    def update(self, frame: ndarray) -> Optional[list[int]]:
+        """Find the tracked face in a new frame.
+
+        Args:
+            frame (ndarray): The new frame.
+
+        Returns:
+            Optional[list[int]]: The new face box, or None if the face was lost
+                (in which case a full detection should be run).
+        """
+        if self.box is None or self._template is None:
+            return None
+        x, y, w, h = self.box
+        mx = int(w * self._search_margin)
+        my = int(h * self._search_margin)
+        x0, y0 = max(x - mx, 0), max(y - my, 0)
+        x1 = min(x + w + mx, frame.shape[1])
+        y1 = min(y + h + my, frame.shape[0])
+        if x1 - x0 < w or y1 - y0 < h:
+            self.box = None
+            return None
+
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        scores = cv2.matchTemplate(gray, self._template, cv2.TM_CCOEFF_NORMED)
+        _, self.confidence, _, (bx, by) = cv2.minMaxLoc(scores)
+        self._frames_tracked += 1
+        if self.confidence < self._min_confidence:
+            self.box = None
+            return None
+        self.box = [x0 + bx, y0 + by, w, h]
+        return self.box
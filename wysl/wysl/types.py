@@ -5,14 +5,18 @@ These should just be type annotations for use throughout the code base.
 
 from __future__ import annotations
 
-from collections import deque
 from multiprocessing.connection import Connection
 from queue import Queue
-from typing import (Any, Callable, Mapping, NamedTuple, Protocol, TypedDict,
-                    Union)
+from typing import (TYPE_CHECKING, Any, Callable, Mapping, NamedTuple,
+                    Optional, Protocol, TypedDict, Union)
+
+from numpy import ndarray
 
 from .enums import CommandEnum, ErrorEnum, EventEnum, LocationEnum
 
+if TYPE_CHECKING:
+    from .channel import ChannelConnection
+
 
 class FERDict(TypedDict):
     """Type annotation for box+emotion dictionaries returned by FER."""
@@ -40,6 +44,48 @@ class Payload(NamedTuple):
     others: Any = None
 
 
+class VideoSource(Protocol):
+    """Type hint for cv2.VideoCapture and objects that mimic it."""
+
+    def isOpened(_) -> bool:
+        """Call, dummy."""
+        ...
+
+    def read(_) -> tuple[bool, Any]:
+        """Call, dummy."""
+        ...
+
+    def get(_, prop: int) -> float:
+        """Call, dummy."""
+        ...
+
+    def release(_) -> None:
+        """Call, dummy."""
+        ...
+
+
+class TimedEvent(NamedTuple):
+    """Event sent from a detection process to the main process.
+
+    The timestamp is the time (as returned by `time.monotonic`) at which the
+    frame or audio chunk the event was detected in was captured. Features
+    (scores, volumes, etc) are only sent over a shared memory channel (see
+    `wysl.channel`), which also sends an event of None for frames or chunks
+    whose classification was held back.
+    """
+
+    event: Optional[EventEnum]
+    timestamp: float
+    features: Any = None
+
+
+class StatsReport(NamedTuple):
+    """Timing statistics sent from a process to the main process."""
+
+    source: str
+    summary: dict[str, dict[str, float]]
+
+
 class EventHandler(Protocol):
     """Type hint for event_handler."""
 
@@ -55,15 +101,16 @@ class ChannelSetter(Protocol):
 
     def __call__(_, channel: int,
                  state: CommandEnum,
-                 interval: int = 0) -> None:
+                 interval: int = 0,
+                 urgent: bool = False) -> None:
         """Call, dummy."""
         ...
 
 
 ITCQueue = Queue[Payload]
 Queues = Mapping[str, ITCQueue]
-Pipes = Mapping[str, Connection]
+Pipes = Mapping[str, Union[Connection, "ChannelConnection"]]
 NonNetworkEnum = Union[CommandEnum, EventEnum, ErrorEnum]
 ExpressionClassifier = Callable[[FEREmotions], EventEnum]
 FERList = list[FERDict]
-FloatDeque = deque[float]
+FrameDisplay = Callable[[ndarray, FERList], None]
@@ -0,0 +1,165 @@
+"""Camera preview display process.
+
+Drawing the camera preview and pumping the GUI event loop takes a measurable
+part of each frame's time, so rather than doing so on the inference critical
+path, the expression process can hand its frames and face boxes to a separate
+viewer process through shared memory. The viewer renders them at its own
+(lower) rate.
+
+The shared memory block is laid out as a small header, followed by the face
+boxes and then the raw frame. The header holds a sequence number, which the
+writer makes odd while it is writing and even once it is done, so the viewer
+can tell when it has read a torn frame and should try again.
+"""
+
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from .types import FERList
+
+logger = mp.get_logger()
+
+# Header fields.
+SEQUENCE, QUIT, STOP, BOX_COUNT = range(4)
+HEADER_FIELDS = 4
+MAX_BOXES = 8
+BOXES_OFFSET = HEADER_FIELDS * 8
+FRAME_OFFSET = BOXES_OFFSET + MAX_BOXES * 4 * 4
+
+
+def _views(buf: memoryview,
+           shape: tuple[int, ...]) -> tuple[ndarray, ndarray, ndarray]:
+    """Map the header, boxes and frame arrays onto a shared memory buffer."""
+    header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+    boxes = np.ndarray((MAX_BOXES, 4), dtype=np.int32, buffer=buf,
+                       offset=BOXES_OFFSET)
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=FRAME_OFFSET)
+    return header, boxes, frame
+
+
+class FramePublisher:
+    """Publish frames and face boxes to a viewer process."""
+
+    def __init__(self, fps: float = 10.0) -> None:
+        """Initialise the object.
+
+        The shared memory and viewer process are only created when the first
+        frame is published, as the frame size isn't known until then.
+
+        Args:
+            fps (float, optional): Rate at which the viewer should render.
+                Defaults to 10.0.
+        """
+        self._fps = fps
+        self._shm: Optional[SharedMemory] = None
+        self._proc: Optional[mp.Process] = None
+        self._header: Optional[ndarray] = None
+        self._boxes: Optional[ndarray] = None
+        self._frame: Optional[ndarray] = None
+
+    @property
+    def quit_requested(self) -> bool:
+        """Whether the user has asked to quit from the viewer window."""
+        return self._header is not None and bool(self._header[QUIT])
+
+    def __call__(self, frame: ndarray, emotions_list: FERList) -> None:
+        """Publish a frame.
+
+        Args:
+            frame (ndarray): The frame to show.
+            emotions_list (FERList): List of the emotions as returned by FER.
+                The box of the first face is highlighted.
+        """
+        if self._shm is None:
+            self._start(frame.shape)
+        assert (self._header is not None and self._boxes is not None
+                and self._frame is not None)
+        if frame.shape != self._frame.shape:
+            return
+        count = min(len(emotions_list), MAX_BOXES)
+        self._header[SEQUENCE] += 1
+        self._frame[:] = frame
+        for i in range(count):
+            self._boxes[i] = emotions_list[i]['box']
+        self._header[BOX_COUNT] = count
+        self._header[SEQUENCE] += 1
+
+    def close(self) -> None:
+        """Stop the viewer and release the shared memory."""
+        if self._header is not None:
+            self._header[STOP] = 1
+        if self._proc is not None:
+            self._proc.join(1)
+            if self._proc.is_alive():
+                self._proc.terminate()
+        self._header = self._boxes = self._frame = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _start(self, shape: tuple[int, ...]) -> None:
+        """Create the shared memory and start the viewer process."""
+        size = FRAME_OFFSET + int(np.prod(shape))
+        self._shm = SharedMemory(create=True, size=size)
+        self._header, self._boxes, self._frame = _views(self._shm.buf, shape)
+        self._header[:] = 0
+        self._proc = mp.Process(name="ViewerProcess",
+                                target=viewer_loop,
+                                daemon=True,
+                                kwargs={
+                                    "name": self._shm.name,
+                                    "shape": shape,
+                                    "fps": self._fps
+                                })
+        self._proc.start()
+
+
+def viewer_loop(name: str, shape: tuple[int, ...], fps: float) -> None:
+    """Render frames published by a FramePublisher.
+
+    Args:
+        name (str): Name of the shared memory block.
+        shape (tuple[int, ...]): Shape of the frames.
+        fps (float): Rate at which to render.
+    """
+    logger.info("Starting: %s", locals())
+    shm = SharedMemory(name=name)
+    header, boxes, frame = _views(shm.buf, shape)
+    delay = max(int(1000 / fps), 1) if fps > 0 else 1
+    last = -1
+    while not header[STOP]:
+        sequence = int(header[SEQUENCE])
+        if sequence != last and sequence % 2 == 0:
+            image = frame.copy()
+            shown = boxes[:int(header[BOX_COUNT])].copy()
+            # Only show the frame if it wasn't written to while copying.
+            if header[SEQUENCE] == sequence:
+                last = sequence
+                do_show(image, shown)
+        if cv2.waitKey(delay) == ord('q'):
+            header[QUIT] = 1
+
+    del header, boxes, frame
+    cv2.destroyAllWindows()
+    shm.close()
+
+
+def do_show(frame: ndarray, boxes: Sequence[Sequence[int]]) -> None:
+    """Draw face boxes onto a frame and display it.
+
+    Args:
+        frame (ndarray): The frame to show.
+        boxes (Sequence[Sequence[int]]): Face boxes, as [x, y, width, height].
+            The first is highlighted.
+    """
+    for i, (x, y, w, h) in enumerate(boxes):
+        colour = (0, 155, 255) if i == 0 else (200, 200, 200)
+        cv2.rectangle(frame, (int(x), int(y)), (int(x+w), int(y+h)), colour,
+                      5 if i == 0 else 2)
+    cv2.imshow('Camera feed', frame)
@@ -0,0 +1,151 @@
+"""Waveform display for the laughter process.
+
+Redrawing a whole matplotlib figure for every audio chunk costs more CPU than
+detecting laughter in it. A `WaveformPlot` instead draws the static parts of
+the figure (axes and title) once, and thereafter only redraws the waveform,
+volume and threshhold lines over a cached copy of the background (blitting),
+at a capped rate.
+
+Detection hands its latest chunk to the plot with `publish`, which only
+stores a reference, so it may be called from the detection thread while the
+GUI thread runs `update`.
+"""
+
+import multiprocessing as mp
+import time
+from typing import Any, Callable, Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backend_bases import CloseEvent, DrawEvent
+from numpy import ndarray
+
+from .instrumentation import NO_INSTRUMENTATION, Instrumentation
+
+logger = mp.get_logger()
+
+
+class WaveformPlot:
+    """Blitted plot of the latest audio chunk and its volume."""
+
+    def __init__(self,
+                 chunk_size: int,
+                 threshhold: float,
+                 sample_width: int = 2,
+                 fps: float = 15.0,
+                 on_close: Optional[Callable[[CloseEvent], Any]] = None,
+                 timer: Instrumentation = NO_INSTRUMENTATION) -> None:
+        """Initialise the object, and show the figure.
+
+        Args:
+            chunk_size (int): Number of samples per chunk.
+            threshhold (float): Initial laughter threshhold, shown as dotted
+                lines.
+            sample_width (int, optional): Sample width in bytes, which sets
+                the vertical range. Defaults to 2.
+            fps (float, optional): Maximum rate at which to redraw.
+                Defaults to 15.0.
+            on_close (Optional[Callable[[CloseEvent], Any]], optional):
+                Function to call when the window is closed. Defaults to None.
+            timer (Instrumentation, optional): Instrumentation with which to
+                time each redraw. Defaults to NO_INSTRUMENTATION.
+        """
+        self._period = 1 / fps if fps > 0 else 0.0
+        self._timer = timer
+        self._latest: Optional[tuple[ndarray, float, float]] = None
+        self._shown: Optional[tuple[ndarray, float, float]] = None
+        self._background: Any = None
+        self._next_draw = 0.0
+
+        plt.ioff()
+        self.figure, ax = plt.subplots()
+        self._ax = ax
+        self._threshhold = [ax.axhline(y, color="C0", linestyle='dotted',
+                                       label="Threshhold", animated=True)
+                            for y in (-threshhold, threshhold)]
+        (self._line,) = ax.plot(np.arange(chunk_size), np.zeros(chunk_size),
+                                label="Waveform", animated=True)
+        self._volume = [ax.axhline(y, color="C1", label="Volume",
+                                   animated=True)
+                        for y in (0, 0)]
+        ax.set_xlim(0, chunk_size-1)
+        ax.set_ylim(-(2**(8*sample_width))/2, (2**(8*sample_width))/2)
+        ax.set_title("Raw Audio Signal")
+        plt.tight_layout()
+        canvas = self.figure.canvas
+        canvas.mpl_connect('draw_event', self._on_draw)
+        if on_close is not None:
+            canvas.mpl_connect('close_event', on_close)
+        plt.show(block=False)
+        canvas.draw()
+
+    def publish(self,
+                samples: ndarray,
+                volume: float,
+                threshhold: float) -> None:
+        """Hand the latest chunk to the plot, to be drawn on its next update.
+
+        Args:
+            samples (ndarray): Samples of the chunk.
+            volume (float): Volume (RMS) of the chunk.
+            threshhold (float): Current laughter threshhold.
+        """
+        self._latest = (samples, volume, threshhold)
+
+    def update(self) -> None:
+        """Redraw if there is a new chunk, and run the GUI until it's due.
+
+        This must be called from the thread that created the plot.
+        """
+        latest = self._latest
+        if latest is not None and latest is not self._shown:
+            start = time.monotonic()
+            self._shown = latest
+            self._draw(*latest)
+            self._timer.record("display", time.monotonic() - start)
+        # Keep the window responsive until the next redraw is due.
+        now = time.monotonic()
+        self._next_draw = max(self._next_draw + self._period, now)
+        self.figure.canvas.start_event_loop(
+            max(self._next_draw - now, 0.001))
+
+    def close(self) -> None:
+        """Close the figure."""
+        plt.close(self.figure)
+
+    def _draw(self,
+              samples: ndarray,
+              volume: float,
+              threshhold: float) -> None:
+        """Draw the animated artists over the cached background."""
+        canvas = self.figure.canvas
+        if self._background is None:
+            # The draw event will cache the background.
+            canvas.draw()
+            if self._background is None:
+                return
+        if len(samples) == len(self._line.get_xdata()):
+            self._line.set_ydata(samples)
+        for line, y in zip(self._volume, (-volume, volume)):
+            line.set_ydata([y, y])
+        for line, y in zip(self._threshhold, (-threshhold, threshhold)):
+            line.set_ydata([y, y])
+        canvas.restore_region(self._background)
+        self._draw_artists()
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+    def _on_draw(self, event: DrawEvent) -> None:
+        """Cache the background whenever the whole figure is redrawn.
+
+        This happens when the figure is first shown and whenever the window
+        is resized.
+        """
+        canvas = self.figure.canvas
+        self._background = canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self) -> None:
+        """Draw the animated artists."""
+        for artist in (self._line, *self._volume, *self._threshhold):
+            self._ax.draw_artist(artist)